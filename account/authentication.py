@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User, user_snapshot_cache_key
+
+# Fields kept in the cached snapshot; enough for permission and role checks.
+SNAPSHOT_FIELDS = (
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "role",
+    "gender",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "is_registration_completed",
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that reads the user from a short-lived cache snapshot.
+
+    A cache hit builds the ``User`` from the snapshot without touching the
+    database. Snapshots are dropped whenever the user is saved or deleted
+    and expire after ``USER_SNAPSHOT_CACHE_TTL`` seconds regardless.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares against the password hash, which is never cached.
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = user_snapshot_cache_key(user_id)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            try:
+                snapshot = User.objects.values(*SNAPSHOT_FIELDS).get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except User.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, snapshot, timeout=settings.USER_SNAPSHOT_CACHE_TTL)
+
+        # Fields outside the snapshot stay deferred: they load on access and
+        # save() only writes the loaded ones, so nothing is blanked out.
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in snapshot]
+        user = User.from_db("default", field_names, [snapshot[name] for name in field_names])
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,30 @@
+import io
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def make_thumbnail(image_file, size=None) -> ContentFile:
+    """
+    Build a small WebP thumbnail from an uploaded image.
+
+    Args:
+        image_file: File-like object holding the original image
+        size: Bounding box as (width, height); defaults to PROFILE_THUMBNAIL_SIZE
+
+    Returns:
+        ContentFile with a unique name, ready to assign to an ImageField
+    """
+    size = size or settings.PROFILE_THUMBNAIL_SIZE
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=80)
+    image_file.seek(0)
+    return ContentFile(buffer.getvalue(), name=f"{uuid.uuid4()}.webp")
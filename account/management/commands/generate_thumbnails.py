@@ -0,0 +1,27 @@
+from account.models import User
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Generates profile picture thumbnails for users that do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        users = (
+            User.objects.exclude(profile_picture__isnull=True)
+            .exclude(profile_picture='')
+            .filter(profile_thumbnail__isnull=True)
+        )
+        generated = 0
+        for user in users.iterator(chunk_size=options['chunk_size']):
+            # Forget the stored picture so save() treats it as a fresh upload.
+            user._loaded_profile_picture = None
+            try:
+                user.save(update_fields=['profile_thumbnail'])
+            except (OSError, ValueError) as e:
+                self.stderr.write(f'Skipping {user.email}: {e}')
+                continue
+            generated += 1
+        self.stdout.write(f'Generated {generated} thumbnail(s).')
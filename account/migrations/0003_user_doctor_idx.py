@@ -0,0 +1,17 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_user_role'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('role', 'doctor')), fields=['date_joined', 'id'], name='user_doctor_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_user_doctor_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='profile_pictures/thumbnails'),
+        ),
+    ]
@@ -4,9 +4,13 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext as _
-from django.db.models.signals import pre_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from .images import make_thumbnail
+
 
 class UserQuerySet(models.QuerySet):
     def active(self):
@@ -101,6 +105,10 @@ class User(AbstractUser):
     profile_picture = models.ImageField(
         upload_to="profile_pictures", blank=True, null=True
     )
+    # Generated from profile_picture on upload; list endpoints link to this.
+    profile_thumbnail = models.ImageField(
+        upload_to="profile_pictures/thumbnails", blank=True, null=True, editable=False
+    )
     is_registration_completed = models.BooleanField(default=False)
     
     # New field for role – allowed values: patient or doctor
@@ -117,6 +125,36 @@ class User(AbstractUser):
     EMAIL_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember stored values so save() and receivers can tell what changed.
+        instance._loaded_role = instance.__dict__.get("role")
+        instance._loaded_profile_picture = instance.__dict__.get("profile_picture")
+        return instance
+
+    def save(self, *args, **kwargs):
+        picture_loaded = "profile_picture" not in self.get_deferred_fields()
+        picture_name = self.profile_picture.name if picture_loaded and self.profile_picture else None
+        if picture_loaded and picture_name != getattr(self, "_loaded_profile_picture", None):
+            self.profile_thumbnail = make_thumbnail(self.profile_picture) if picture_name else None
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "profile_thumbnail"}
+        super().save(*args, **kwargs)
+        if picture_loaded:
+            self._loaded_profile_picture = picture_name
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Doctor directory lookups; patients are the bulk of the table.
+            models.Index(
+                fields=["date_joined", "id"],
+                name="user_doctor_idx",
+                condition=models.Q(role="doctor"),
+            ),
+        ]
+
 @receiver(pre_save, sender=User)
 def change_user_registation_status(sender, instance: User, **kwargs):
     required_fields = [
@@ -131,4 +169,16 @@ def change_user_registation_status(sender, instance: User, **kwargs):
     ):
         instance.is_registration_completed = False
     else:
-        instance.is_registration_completed = True
\ No newline at end of file
+        instance.is_registration_completed = True
+
+
+def user_snapshot_cache_key(user_id) -> str:
+    return f"account:user-snapshot:{user_id}"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance: User, **kwargs):
+    # Drop the cached auth snapshot once the change is visible to other requests.
+    key = user_snapshot_cache_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
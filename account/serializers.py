@@ -6,7 +6,9 @@ from .models import User
 
 
 class UserSerializer(serializers.ModelSerializer):
-    profile_picture = Base64ImageField(required=False)
+    # Accepts base64 on write; always read back as URLs, never inlined bytes.
+    profile_picture = Base64ImageField(required=False, represent_in_base64=False)
+    profile_thumbnail = serializers.ImageField(read_only=True)
 
     class Meta:
         model = User
@@ -27,6 +29,7 @@ class SignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, style={"input_type": "password"})
     profile_picture = Base64ImageField(
         required=False,
+        represent_in_base64=False,
         help_text="Base64 encoded image string. Example: '/9j/4AAQSkZJRgABAQAAAQABAAD...'"
     )
     
@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account.factories import UserFactory
+from account.models import User
+from config.testing.base import BaseAPITest
+from hospital.views import PatientDoctorListView
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CachedJWTAuthenticationTest(BaseAPITest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.doctor = UserFactory(role="doctor")
+        self.patient = UserFactory(role="patient")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.patient)}")
+        self.url = reverse("patient_doctor_list")
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_warm_cache_saves_user_lookup(self):
+        with patch.object(PatientDoctorListView, "authentication_classes", [JWTAuthentication]):
+            uncached = [self.count_queries() for _ in range(3)]
+        cached = [self.count_queries() for _ in range(3)]
+
+        # Benchmark: the stock backend loads the user on every request; the
+        # cached one only on the first, saving one round-trip per request.
+        self.assertEqual(uncached, [uncached[0]] * 3)
+        self.assertEqual(cached, [uncached[0], uncached[0] - 1, uncached[0] - 1])
+
+    def test_snapshot_invalidated_on_save(self):
+        self.count_queries()
+        self.patient.role = "doctor"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(pk=self.patient.pk).update(is_active=False)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_save_keeps_unloaded_fields(self):
+        self.patient.set_password("VerySecurePass!123")
+        self.patient.save()
+        self.count_queries()
+
+        response = self.client.patch(reverse("account_userprofile"), {"first_name": "New"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.patient.refresh_from_db()
+        self.assertTrue(self.patient.check_password("VerySecurePass!123"))
@@ -1,7 +1,14 @@
+import tempfile
+from urllib.parse import urlparse
+
 from account.factories import UserFactory
+from django.conf import settings
+from django.test import AsyncClient, override_settings
+from PIL import Image
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework_simplejwt.tokens import AccessToken
 from config.testing.base import BaseAPITest
 from account.models import User
 
@@ -35,6 +42,32 @@ class UserprofleTest(BaseAPITest):
         self.assertIn("access", response.data)
         self.assertIn("refresh", response.data)
         
+    async def test_signup_and_login_under_asgi(self):
+        credentials = {"email": "carol@example.com", "password": "VerySecurePass!123"}
+        response = await AsyncClient().post(
+            reverse("account_signup"), {**credentials, "name": "Carol Doe", "role": "patient"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = await AsyncClient().post(reverse("account_login"), credentials, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await AsyncClient().post(
+            reverse("token_refresh"), {"refresh": response.json()["data"]["refresh"]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", response.json()["data"])
+
+    async def test_userprofile_under_asgi(self):
+        url = reverse("account_userprofile")
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.test_user)}"}
+
+        response = await AsyncClient().patch(url, {"first_name": "Async"}, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["data"]["first_name"], "Async")
+        response = await AsyncClient().get(url, headers=headers)
+        self.assertEqual(response.json()["data"]["first_name"], "Async")
+
     def test_get_userprofile(self):
         url = reverse("account_userprofile")
 
@@ -92,6 +125,40 @@ class UserprofleTest(BaseAPITest):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIsNotNone(res.data.get("profile_picture"))
 
+    def test_profile_picture_returns_urls_and_thumbnail(self):
+        self.client.force_authenticate(user=self.test_user)
+        url = reverse("account_userprofile")
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            res: Response = self.client.patch(
+                url, {"profile_picture": self.generate_base64_photo_file()}, format="json"
+            )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res.data["profile_picture"].startswith("http"))
+            thumbnail_url = res.data["profile_thumbnail"]
+            self.assertTrue(urlparse(thumbnail_url).path.endswith(".webp"))
+
+            self.test_user.refresh_from_db()
+            with Image.open(self.test_user.profile_thumbnail.path) as thumbnail:
+                self.assertLessEqual(max(thumbnail.size), max(settings.PROFILE_THUMBNAIL_SIZE))
+
+            media = self.client.get(thumbnail_url)
+            self.assertEqual(media.status_code, status.HTTP_200_OK)
+            self.assertTrue(media["Cache-Control"].startswith("private"))
+
+            # Without a valid signature the file is not served.
+            unsigned = urlparse(thumbnail_url).path
+            self.assertEqual(self.client.get(unsigned).status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(
+                self.client.get(thumbnail_url.replace("signature=", "signature=0")).status_code,
+                status.HTTP_404_NOT_FOUND,
+            )
+
+            # Saving without a new picture keeps the existing thumbnail.
+            self.client.patch(url, {"first_name": "Other"}, format="json")
+            self.test_user.refresh_from_db()
+            self.assertEqual(urlparse(self.test_user.profile_thumbnail.url).path, unsigned)
+
     def test_delete_account(self):
         self.client.force_authenticate(user=self.test_user)
         url = reverse("account_userprofile")
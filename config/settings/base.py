@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import environ
 from datetime import timedelta
+from kombu import Queue
 from django.core.management.utils import get_random_secret_key
 
 
@@ -113,7 +114,7 @@ LOGGING = {
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
@@ -128,19 +129,78 @@ REST_FRAMEWORK = {
         # Any other parsers
     ),
     'EXCEPTION_HANDLER': 'config.utils.exception_handler.custom_exception_handler',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'config.utils.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
 }
 
 # Celery Configuration Options
 CELERY_BROKER_URL = env('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = 'django-db'
+# Results of tasks that opt in to storing them (most set ignore_result) go to
+# Redis, where they expire, instead of to the primary database. Set to
+# 'django-db' to keep them in django_celery_results' tables.
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)
+CELERY_RESULT_EXPIRES = timedelta(hours=env.int('CELERY_RESULT_EXPIRES_HOURS', default=24))
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_ALWAYS_EAGER = env('CELERY_TASK_ALWAYS_EAGER', default=True)
 CELERY_TASK_EAGER_PROPAGATES = env('CELERY_TASK_EAGER_PROPAGATES', default=True)
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Slow, I/O-bound LLM extraction and cheap reminder checks get queues of their
+# own, so an LLM backlog never delays reminders. Run a worker per queue (see
+# README) and scale each independently; a worker without -Q consumes all.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (Queue('default'), Queue('llm'), Queue('reminders'))
+CELERY_TASK_ROUTES = {
+    'hospital.tasks.process_doctor_note': {'queue': 'llm'},
+    'hospital.tasks.process_doctor_note_batch': {'queue': 'llm'},
+    'hospital.services.scheduler.dispatch_due_reminders': {'queue': 'reminders'},
+    'hospital.services.scheduler.schedule_check_reminder': {'queue': 'reminders'},
+}
+# Acknowledge once the task has run, so work held by a crashed worker is
+# redelivered instead of lost; the tasks above are safe to run twice.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Messages reserved per worker process. Prefetch is a per-worker setting, so
+# set it on each queue's workers: 1 for the llm queue, where tasks are long
+# and uneven, higher for short reminder tasks.
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int('CELERY_WORKER_PREFETCH_MULTIPLIER', default=1)
+# Redis redelivers a reserved but unacknowledged message after this many
+# seconds. Keep it above the longest task run time and countdown (LLM retries
+# wait at most 10 minutes, or LLM_RETRY_AFTER_MAX), or tasks will run twice.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': env.int('CELERY_VISIBILITY_TIMEOUT', default=60 * 60),
+}
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-due-reminders': {
+        'task': 'hospital.services.scheduler.dispatch_due_reminders',
+        'schedule': timedelta(minutes=1),
+    },
+    'requeue-stalled-notes': {
+        'task': 'hospital.tasks.requeue_stalled_notes',
+        'schedule': timedelta(minutes=5),
+    },
+    'prune-task-results': {
+        'task': 'hospital.tasks.prune_task_results',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+# Age after which rows in the database result tables are pruned
+TASK_RESULT_RETENTION = timedelta(days=env.int('TASK_RESULT_RETENTION_DAYS', default=7))
+TASK_RESULT_PRUNE_BATCH_SIZE = env.int('TASK_RESULT_PRUNE_BATCH_SIZE', default=5000)
+
+# Seconds after which a note claimed for LLM processing may be claimed again,
+# in case its worker died; keep it above the longest extraction with retries
+NOTE_PROCESSING_TIMEOUT = env.int('NOTE_PROCESSING_TIMEOUT', default=15 * 60)
+# Notes re-enqueued per run of the stalled-note sweep
+NOTE_REQUEUE_BATCH_SIZE = env.int('NOTE_REQUEUE_BATCH_SIZE', default=500)
+
+# Reminder dispatcher: steps fetched per batch, and batches per beat tick
+REMINDER_DISPATCH_BATCH_SIZE = env.int('REMINDER_DISPATCH_BATCH_SIZE', default=500)
+REMINDER_DISPATCH_MAX_BATCHES = env.int('REMINDER_DISPATCH_MAX_BATCHES', default=100)
 
 GRAPH_MODELS = {
     "all_applications": True,
@@ -190,6 +250,13 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
+# Seconds an authenticated user's snapshot is served from cache
+USER_SNAPSHOT_CACHE_TTL = env.int('USER_SNAPSHOT_CACHE_TTL', default=300)
+
+# Seconds a rendered doctor directory page is kept (versioned, so edits show at
+# once); capped at MEDIA_URL_TTL, since pages hold signed media URLs
+DOCTOR_DIRECTORY_CACHE_TTL = env.int('DOCTOR_DIRECTORY_CACHE_TTL', default=60 * 60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -231,6 +298,12 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are served only through signed, expiring URLs (see
+# config.utils.media); a URL stays valid for one to two windows of this many seconds
+DEFAULT_FILE_STORAGE = 'config.utils.media.SignedMediaStorage'
+MEDIA_URL_TTL = env.int('MEDIA_URL_TTL', default=60 * 60)
+PROFILE_THUMBNAIL_SIZE = (128, 128)
+
 # Override static files storage setting for production
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -241,8 +314,62 @@ CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS", default=["http://localho
 
 GEMINY_FLASH_API_KEY = env('GEMINY_FLASH_API_KEY', default='your-default-api-key')
 
+# LLM provider. Set LLM_BACKEND to hospital.services.backends.StubBackend to
+# load test against the in-process stub (see manage.py run_llm_stub for an
+# HTTP one).
+LLM_BACKEND = env('LLM_BACKEND', default='hospital.services.backends.GeminiBackend')
+LLM_BASE_URL = env('LLM_BASE_URL', default='https://generativelanguage.googleapis.com/v1beta/models')
+LLM_MODEL = env('LLM_MODEL', default='gemini-1.5-flash')
+LLM_STUB_LATENCY = env.float('LLM_STUB_LATENCY', default=0.5)
+LLM_STUB_JITTER = env.float('LLM_STUB_JITTER', default=0.1)
+LLM_STUB_ERROR_RATE = env.float('LLM_STUB_ERROR_RATE', default=0.0)
+LLM_STUB_RATE_LIMIT_RATE = env.float('LLM_STUB_RATE_LIMIT_RATE', default=0.0)
+LLM_STUB_SEED = env.int('LLM_STUB_SEED', default=0)
+
+# LLM HTTP client pool (one long-lived client per worker process)
+LLM_HTTP2 = env.bool('LLM_HTTP2', default=True)
+LLM_HTTP_MAX_CONNECTIONS = env.int('LLM_HTTP_MAX_CONNECTIONS', default=20)
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = env.int('LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS', default=10)
+LLM_HTTP_KEEPALIVE_EXPIRY = env.float('LLM_HTTP_KEEPALIVE_EXPIRY', default=60.0)
+LLM_HTTP_CONNECT_TIMEOUT = env.float('LLM_HTTP_CONNECT_TIMEOUT', default=5.0)
+LLM_HTTP_TIMEOUT = env.float('LLM_HTTP_TIMEOUT', default=60.0)
+
+# Cluster-wide LLM rate limits (shared through Redis) and retry policy
+LLM_RATE_LIMIT_PER_MINUTE = env.int('LLM_RATE_LIMIT_PER_MINUTE', default=60)
+LLM_RATE_LIMIT_BURST = env.int('LLM_RATE_LIMIT_BURST', default=10)
+LLM_MAX_IN_FLIGHT = env.int('LLM_MAX_IN_FLIGHT', default=8)
+LLM_MAX_RETRIES = env.int('LLM_MAX_RETRIES', default=4)
+LLM_RETRY_BASE_DELAY = env.float('LLM_RETRY_BASE_DELAY', default=1.0)
+LLM_RETRY_MAX_DELAY = env.float('LLM_RETRY_MAX_DELAY', default=30.0)
+# Longest Retry-After a task retry will honour, in seconds; must stay below
+# CELERY_VISIBILITY_TIMEOUT
+LLM_RETRY_AFTER_MAX = env.int('LLM_RETRY_AFTER_MAX', default=600)
+
+# Ask the model for schema-constrained JSON (Gemini JSON mode)
+LLM_JSON_MODE = env.bool('LLM_JSON_MODE', default=True)
+
+# Content-addressed cache of parsed LLM extraction results
+LLM_CACHE_ENABLED = env.bool('LLM_CACHE_ENABLED', default=True)
+LLM_CACHE_ALIAS = 'default'
+LLM_CACHE_TTL = env.int('LLM_CACHE_TTL', default=60 * 60 * 24 * 7)
+LLM_CACHE_MAX_ENTRIES = env.int('LLM_CACHE_MAX_ENTRIES', default=10000)
+
+# Coalesce bursts of doctor notes into batches of concurrent LLM calls
+LLM_BATCH_ENABLED = env.bool('LLM_BATCH_ENABLED', default=False)
+LLM_BATCH_SIZE = env.int('LLM_BATCH_SIZE', default=20)
+LLM_BATCH_WINDOW = env.float('LLM_BATCH_WINDOW', default=2.0)
+LLM_BATCH_CONCURRENCY = env.int('LLM_BATCH_CONCURRENCY', default=8)
+
+# Not read by django-cryptography: encrypted fields derive their key from
+# CRYPTOGRAPHY_KEY (default SECRET_KEY) and are signed with SECRET_KEY. After
+# changing either, run `manage.py rotate_note_encryption`.
 FERNET_KEYS = [os.environ.get('FERNET_KEY', 'your-default-key-if-any')]
 
+# Secret of the blind keyword index over encrypted notes. A purpose-specific
+# HMAC key is derived from it (or from SECRET_KEY when unset); changing it,
+# or SECRET_KEY while it is unset, requires `manage.py rebuild_note_search_index`
+NOTE_SEARCH_KEY = env('NOTE_SEARCH_KEY', default=None)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -3,8 +3,13 @@ import dj_database_url
 
 DEBUG = False
 
+# Under ASGI each request runs its sync ORM calls in a fresh thread, so
+# persistent connections are never reused; set CONN_MAX_AGE=0 for the web
+# process there and keep it for Celery workers.
 DATABASES = {
-    'default': dj_database_url.parse(env('DATABASE_URL'), conn_max_age=600),
+    'default': dj_database_url.parse(
+        env('DATABASE_URL'), conn_max_age=env.int('CONN_MAX_AGE', default=600)
+    ),
 }
 
 
@@ -0,0 +1,61 @@
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import Http404
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.views.static import serve
+
+_SALT = "config.utils.media"
+
+
+def media_expiry(now=None) -> int:
+    """
+    Expiry of media URLs signed now.
+
+    Rounded up to a whole ``MEDIA_URL_TTL`` window, so a file's URL stays the
+    same for a while and clients can reuse their cached copy. A URL is valid
+    for between one and two windows.
+    """
+    ttl = settings.MEDIA_URL_TTL
+    now = int(time.time() if now is None else now)
+    return (now // ttl + 2) * ttl
+
+
+def media_signature(name: str, expires: int) -> str:
+    return salted_hmac(_SALT, f"{name}:{expires}").hexdigest()
+
+
+class SignedMediaStorage(FileSystemStorage):
+    """
+    Local media storage whose URLs carry an expiring signature.
+
+    Uploads (patient profile pictures among them) are only handed out in
+    authenticated API responses; the signature lets the browser load the
+    URL it was given there, without making the files public.
+    """
+
+    def url(self, name):
+        url = super().url(name)
+        if name is None:
+            return url
+        expires = media_expiry()
+        return f"{url}?{urlencode({'expires': expires, 'signature': media_signature(name, expires)})}"
+
+
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT if the request carries a valid, unexpired signature."""
+    try:
+        expires = int(request.GET.get("expires", ""))
+    except ValueError:
+        raise Http404
+    remaining = expires - int(time.time())
+    signature = request.GET.get("signature", "")
+    if remaining <= 0 or not constant_time_compare(signature, media_signature(path, expires)):
+        raise Http404
+
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    # Private: shared proxies and CDNs must not keep patient images.
+    response["Cache-Control"] = f"private, max-age={remaining}"
+    return response
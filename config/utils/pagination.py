@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination ordered by ``(created_at, id)``.
+
+    Pages are fetched with a ``WHERE created_at > ...`` seek instead of a
+    ``COUNT(*)`` plus ``OFFSET`` scan, so deep pages cost the same as the
+    first one. Views whose model has no ``created_at`` can set
+    ``pagination_ordering``. Clients that still send ``?page=N`` get the
+    previous page-number responses.
+    """
+    ordering = ('created_at', 'id')
+    page_number_query_param = 'page'
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'pagination_ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_paginator = None
+        if self.page_number_query_param in request.query_params:
+            self.page_number_paginator = PageNumberPagination()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            super().get_schema_operation_parameters(view)
+            + PageNumberPagination().get_schema_operation_parameters(view)
+        )
@@ -0,0 +1,43 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+
+class AsyncAPIViewMixin:
+    """
+    Run a DRF view's handlers as coroutines.
+
+    Mix into any ``APIView`` subclass and declare the handlers with
+    ``async def``. Under ASGI the request is then served on the event loop
+    instead of a worker thread; authentication, permission and throttle
+    checks (which may query the database or cache) are run through
+    ``sync_to_async``. Exception handling and content negotiation are the
+    same as for the synchronous views.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            # OPTIONS and method-not-allowed stay synchronous in DRF.
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
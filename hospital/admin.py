@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import DoctorNote, ActionableStep
+from .services.search import note_search_index
 
 class ActionableStepInline(admin.TabularInline):
     model = ActionableStep
@@ -10,12 +11,30 @@ class ActionableStepInline(admin.TabularInline):
 
 @admin.register(DoctorNote)
 class DoctorNoteAdmin(admin.ModelAdmin):
-    # Assuming your BaseModel adds a 'created' field
-    list_display = ('id', 'doctor', 'patient', 'get_note_excerpt')
-    list_filter = ('doctor', 'patient')
-    search_fields = ('doctor__email', 'patient__email', 'note_text')
+    # The changelist never shows the note body, so skip decrypting it there;
+    # the excerpt is still shown on the change form.
+    list_display = ('id', 'doctor', 'patient', 'processing_status', 'created_at')
+    list_select_related = ('doctor', 'patient')
+    list_filter = ('processing_status', 'doctor', 'patient')
+    # note_text is ciphertext in the database, so it is searched through the
+    # blind keyword index instead (whole words only).
+    search_fields = ('doctor__email', 'patient__email')
+    search_help_text = "Search by doctor or patient email, or by whole words of the note."
+    readonly_fields = ('get_note_excerpt',)
     inlines = [ActionableStepInline]
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.without_note_text()
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(id__in=note_search_index.matching_note_ids(search_term))
+        return results, may_have_duplicates
+
     def get_note_excerpt(self, obj):
         # Display first 50 characters of the note_text field
         text = obj.note_text or ""
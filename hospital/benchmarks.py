@@ -0,0 +1,266 @@
+"""
+End-to-end benchmark of the doctor note pipeline.
+
+Seeds doctors, patients and assignments with ``UserFactory``, then drives
+each note through the same code paths production uses:
+
+1. ``DoctorNoteCreateView`` (the request that stores the note),
+2. ``process_doctor_note`` (LLM extraction and step persistence),
+3. ``dispatch_due_reminders`` (the first reminder check of every plan).
+
+The LLM is replaced by the deterministic ``StubBackend``, so runs are
+repeatable and cost no quota. Results are plain dicts that serialize to
+JSON and can be compared against a previous run with ``compare_results``.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from faker import Faker
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from account.factories import UserFactory
+from .models import ActionableStep, DoctorPatientAssignment
+from .services.llm import llm_client_pool
+from .services.scheduler import dispatch_due_reminders
+from .tasks import process_doctor_note
+from .views import DoctorNoteCreateView
+
+# Metrics where a larger value is an improvement; everything else is a cost.
+HIGHER_IS_BETTER = {"notes_per_sec"}
+
+
+def percentile(values: List[float], pct: int) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def _summary(seconds: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_note_text(fake: Faker) -> str:
+    return " ".join([
+        fake.sentence(),
+        f"Take {fake.word()} daily for {fake.random_int(3, 14)} days.",
+        f"Book a {fake.word()} test.",
+    ])
+
+
+def seed(doctors: int, patients: int):
+    """
+    Create doctors and patients and assign every patient to one doctor.
+
+    Returns:
+        List of DoctorPatientAssignment, with doctor and patient loaded
+    """
+    doctor_users = [UserFactory(role="doctor") for _ in range(doctors)]
+    patient_users = [UserFactory(role="patient") for _ in range(patients)]
+    return DoctorPatientAssignment.objects.bulk_create([
+        DoctorPatientAssignment(doctor=doctor_users[i % doctors], patient=patient)
+        for i, patient in enumerate(patient_users)
+    ])
+
+
+def run_note_pipeline(
+    doctors: int = 5,
+    patients: int = 20,
+    notes: int = 100,
+    llm_latency: float = 0.0,
+    use_cache: bool = False,
+    seed_value: int = 0,
+) -> Dict:
+    """
+    Seed data and push ``notes`` notes through the pipeline.
+
+    Must run inside a transaction the caller rolls back (or a test case),
+    since it writes users, notes and steps.
+
+    Returns:
+        JSON-serializable dict of parameters and measurements
+    """
+    fake = Faker()
+    fake.seed_instance(seed_value)
+
+    llm_settings = dict(
+        LLM_BACKEND="hospital.services.backends.StubBackend",
+        LLM_STUB_LATENCY=llm_latency,
+        LLM_STUB_JITTER=0.0,
+        LLM_STUB_ERROR_RATE=0.0,
+        LLM_STUB_RATE_LIMIT_RATE=0.0,
+        LLM_STUB_SEED=seed_value,
+        LLM_CACHE_ENABLED=use_cache,
+        LLM_BATCH_ENABLED=False,
+        # Measure the pipeline, not the shared rate limiter.
+        LLM_RATE_LIMIT_PER_MINUTE=0,
+        LLM_MAX_IN_FLIGHT=0,
+    )
+
+    with override_settings(**llm_settings):
+        # The pooled client is bound to the backend it was built with.
+        llm_client_pool.close()
+        try:
+            assignments = seed(doctors, patients)
+            note_texts = [make_note_text(fake) for _ in range(notes)]
+            results = _drive(assignments, note_texts)
+        finally:
+            llm_client_pool.close()
+
+    results["params"] = {
+        "doctors": doctors,
+        "patients": patients,
+        "notes": notes,
+        "llm_latency": llm_latency,
+        "use_cache": use_cache,
+        "seed": seed_value,
+    }
+    results["meta"] = {
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "database": connection.vendor,
+        "timestamp": timezone.now().isoformat(),
+    }
+    return results
+
+
+def _count_queries(queries: CaptureQueriesContext) -> int:
+    # Savepoints only appear because the run is wrapped in a transaction
+    # (the command's rollback, or a test case); they are not work.
+    return sum(1 for query in queries.captured_queries if "SAVEPOINT" not in query["sql"])
+
+
+def _drive(assignments, note_texts: List[str]) -> Dict:
+    factory = APIRequestFactory()
+    view = async_to_sync(DoctorNoteCreateView.as_view())
+    request_times, process_times, total_times = [], [], []
+    request_queries = process_queries = 0
+    note_ids = []
+
+    started = time.perf_counter()
+    # Enqueueing is replaced by recording the ID so that each stage is timed
+    # on its own, whatever CELERY_TASK_ALWAYS_EAGER is set to.
+    with patch("hospital.views.enqueue_doctor_note", note_ids.append):
+        for i, note_text in enumerate(note_texts):
+            assignment = assignments[i % len(assignments)]
+            request = factory.post(
+                "/api/hospital/notes/",
+                {"patient": str(assignment.patient_id), "note_text": note_text},
+                format="json",
+            )
+            force_authenticate(request, user=assignment.doctor)
+
+            t0 = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request)
+            t1 = time.perf_counter()
+            if response.status_code != 201:
+                raise RuntimeError(f"Note creation failed with {response.status_code}: {response.data}")
+            request_queries += _count_queries(queries)
+
+            with CaptureQueriesContext(connection) as queries:
+                process_doctor_note.apply(args=[note_ids[-1]], throw=True)
+            t2 = time.perf_counter()
+            process_queries += _count_queries(queries)
+
+            request_times.append(t1 - t0)
+            process_times.append(t2 - t1)
+            total_times.append(t2 - t0)
+    pipeline_elapsed = time.perf_counter() - started
+
+    # Make every plan due now, as if a day had passed, and run the dispatcher.
+    plan_steps = ActionableStep.objects.filter(note_id__in=note_ids, status="pending", step_type="plan")
+    plan_count = plan_steps.update(next_check_at=timezone.now() - timedelta(seconds=1))
+    t0 = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        dispatched = dispatch_due_reminders()
+    reminder_elapsed = time.perf_counter() - t0
+
+    notes = len(note_texts)
+    return {
+        "notes_per_sec": round(notes / pipeline_elapsed, 2) if pipeline_elapsed else None,
+        "latency": {
+            "request": _summary(request_times),
+            "process": _summary(process_times),
+            "total": _summary(total_times),
+        },
+        "queries_per_note": {
+            "request": round(request_queries / notes, 2),
+            "process": round(process_queries / notes, 2),
+        },
+        "reminders": {
+            "steps": plan_count,
+            "dispatched": dispatched,
+            "elapsed_ms": round(reminder_elapsed * 1000, 3),
+            "queries": _count_queries(queries),
+        },
+    }
+
+
+def write_results(results: Dict, path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True))
+    return path
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float = 0.1) -> List[Dict]:
+    """
+    Compare the measurements of two runs.
+
+    Returns:
+        One entry per metric with both values, the relative change and
+        whether it is a regression beyond ``tolerance`` (0.1 = 10%)
+    """
+    skip = ("params", "meta")
+    now = _flatten({k: v for k, v in current.items() if k not in skip})
+    before = _flatten({k: v for k, v in baseline.items() if k not in skip})
+    rows = []
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        change = (new - old) / old if old else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        rows.append({
+            "metric": name,
+            "baseline": old,
+            "current": new,
+            "change": round(change, 4),
+            "regression": worse > tolerance,
+        })
+    return rows
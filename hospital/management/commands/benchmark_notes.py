@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital.benchmarks import compare_results, run_note_pipeline, write_results
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the note pipeline (note request, LLM extraction with a stub '
+        'model, reminder dispatch) on seeded data and reports notes/sec, p50/p99 '
+        'latency and queries per note. All seeded rows are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=5)
+        parser.add_argument('--patients', type=int, default=20)
+        parser.add_argument('--notes', type=int, default=100)
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help='Simulated model latency per call, in seconds.')
+        parser.add_argument('--cache', action='store_true', help='Enable the LLM result cache.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Relative change counted as a regression (default 0.1 = 10%%).')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if min(options['doctors'], options['patients'], options['notes']) < 1:
+            raise CommandError('--doctors, --patients and --notes must be at least 1.')
+
+        results = None
+        try:
+            with transaction.atomic():
+                results = run_note_pipeline(
+                    doctors=options['doctors'],
+                    patients=options['patients'],
+                    notes=options['notes'],
+                    llm_latency=options['llm_latency'],
+                    use_cache=options['cache'],
+                    seed_value=options['seed'],
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['output']:
+            path = write_results(results, options['output'])
+            self.stderr.write(f'Results written to {path}')
+        else:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            rows = compare_results(results, baseline, options['tolerance'])
+            for row in rows:
+                flag = '  REGRESSION' if row['regression'] else ''
+                self.stderr.write(
+                    f"{row['metric']:>28}: {row['baseline']:>10} -> {row['current']:>10} "
+                    f"({row['change']:+.1%}){flag}"
+                )
+            if options['fail_on_regression'] and any(row['regression'] for row in rows):
+                raise CommandError('Benchmark regressed beyond the tolerance.')
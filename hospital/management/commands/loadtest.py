@@ -0,0 +1,111 @@
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account.models import User
+from hospital.models import DoctorPatientAssignment
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives concurrent HTTP load at a running server and reports throughput '
+        'and latency. Run it once against the WSGI deployment and once against '
+        'the ASGI one to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument(
+            '--scenario', choices=['reminders', 'notes'], default='reminders',
+            help='reminders: patients poll GET /reminders/. notes: doctors POST /notes/.',
+        )
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--label', default='', help='Name for this run in the JSON output.')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+
+    def handle(self, *args, **options):
+        targets = self.get_targets(options['scenario'], options['base_url'])
+        if not targets:
+            raise CommandError(
+                'No users to authenticate as; the notes scenario needs doctor/patient '
+                'assignments and the reminders scenario needs patients.'
+            )
+
+        latencies, errors, elapsed = asyncio.run(
+            self.run_load(targets, options['concurrency'], options['requests'], options['timeout'])
+        )
+
+        summary = {
+            'label': options['label'],
+            'scenario': options['scenario'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+            'requests_per_s': round(options['requests'] / elapsed, 1),
+            'p50_ms': round(self.percentile(latencies, 50) * 1000, 1),
+            'p99_ms': round(self.percentile(latencies, 99) * 1000, 1),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(summary))
+        else:
+            for key, value in summary.items():
+                self.stdout.write(f'{key:>15}: {value}')
+
+    def get_targets(self, scenario, base_url):
+        """Return ``(method, url, token, body)`` tuples to cycle through."""
+        if scenario == 'notes':
+            url = f'{base_url}/api/hospital/notes/'
+            assignments = DoctorPatientAssignment.objects.select_related('doctor')[:100]
+            return [
+                ('POST', url, str(AccessToken.for_user(a.doctor)),
+                 {'patient': str(a.patient_id), 'note_text': 'Load test note.'})
+                for a in assignments
+            ]
+        url = f'{base_url}/api/hospital/reminders/'
+        patients = User.objects.filter(role='patient')[:100]
+        return [('GET', url, str(AccessToken.for_user(p)), None) for p in patients]
+
+    async def run_load(self, targets, concurrency, total, timeout):
+        latencies = []
+        errors = 0
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(targets[i % len(targets)])
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+
+            async def worker():
+                nonlocal errors
+                while not queue.empty():
+                    method, url, token, body = queue.get_nowait()
+                    started = time.perf_counter()
+                    try:
+                        response = await client.request(
+                            method, url, json=body, headers={'Authorization': f'Bearer {token}'}
+                        )
+                        if response.status_code >= 400:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        return latencies, errors, elapsed
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from hospital.models import DoctorNote
+from hospital.services.search import note_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the blind keyword index used to search encrypted doctor notes. '
+        'Run it once after deploying the index and whenever NOTE_SEARCH_KEY (or SECRET_KEY, '
+        'while NOTE_SEARCH_KEY is unset) changes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        notes = DoctorNote.objects.only('id', 'note_text').order_by('pk')
+        chunk, indexed, terms = [], 0, 0
+        for note in notes.iterator(chunk_size=chunk_size):
+            chunk.append(note)
+            if len(chunk) >= chunk_size:
+                terms += note_search_index.index_notes(chunk)
+                indexed += len(chunk)
+                chunk = []
+        if chunk:
+            terms += note_search_index.index_notes(chunk)
+            indexed += len(chunk)
+        self.stdout.write(f'Indexed {indexed} note(s), {terms} term(s).')
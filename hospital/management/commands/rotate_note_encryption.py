@@ -0,0 +1,157 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F, Value
+
+from hospital.models import DoctorNote
+from hospital.services import encryption
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encrypts every DoctorNote.note_text from an old key to the current one. '
+        'Set the previous SECRET_KEY (and CRYPTOGRAPHY_KEY, if one was used) in the '
+        'environment, deploy the new key, then run this. Rows are streamed in keyset '
+        'order, re-encrypted across a process pool and written back in checkpointed '
+        'batches, so an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Encryption processes; 0 runs in this process.')
+        parser.add_argument('--checkpoint', help='JSON file recording the last written note, to resume from.')
+        parser.add_argument('--old-secret-key-env', default='OLD_SECRET_KEY',
+                            help='Environment variable holding the previous SECRET_KEY.')
+        parser.add_argument('--old-cryptography-key-env', default='OLD_CRYPTOGRAPHY_KEY',
+                            help='Environment variable holding the previous CRYPTOGRAPHY_KEY, if any.')
+        parser.add_argument('--dry-run', action='store_true', help='Decrypt and count, but write nothing.')
+
+    def handle(self, *args, **options):
+        old_secret_key = os.environ.get(options['old_secret_key_env'])
+        if not old_secret_key:
+            raise CommandError(f"Set {options['old_secret_key_env']} to the SECRET_KEY the notes were encrypted with.")
+        init_args = (
+            old_secret_key,
+            os.environ.get(options['old_cryptography_key_env']) or None,
+            encryption.cipher_key_material(encryption.current_note_cipher()),
+        )
+        batch_size = max(options['batch_size'], 1)
+        workers = max(options['workers'], 0)
+        self.dry_run = options['dry_run']
+        self.checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        self.totals = {'scanned': 0, encryption.ROTATED: 0, encryption.CURRENT: 0, encryption.FAILED: 0}
+
+        last_pk = None
+        if self.checkpoint and self.checkpoint.exists():
+            state = json.loads(self.checkpoint.read_text())
+            last_pk = state['last_pk']
+            self.stdout.write(f'Resuming after note {last_pk}.')
+
+        # Workers are spawned, not forked: the pool starts them lazily, by
+        # which time this process holds an open database connection that a
+        # forked child would share.
+        executor = None
+        if workers:
+            executor = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=encryption.init_rotation_worker,
+                initargs=init_args,
+            )
+        else:
+            encryption.init_rotation_worker(*init_args)
+
+        notes = self.ciphertexts(DoctorNote.objects.order_by('pk'))
+        if last_pk:
+            notes = notes.filter(pk__gt=last_pk)
+
+        self.started = time.monotonic()
+        pending = deque()
+        try:
+            for batch in self.batches(notes.iterator(chunk_size=batch_size), batch_size):
+                if executor:
+                    future = executor.submit(encryption.reencrypt, batch)
+                else:
+                    future = Future()
+                    future.set_result(encryption.reencrypt(batch))
+                pending.append((batch, future))
+                # Bound memory: at most two batches per worker in flight.
+                while len(pending) >= max(workers, 1) * 2:
+                    batch, future = pending.popleft()
+                    self.write_batch(batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                self.write_batch(batch, future.result())
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        elapsed = time.monotonic() - self.started
+        rate = self.totals['scanned'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{'Would rotate' if self.dry_run else 'Rotated'} {self.totals[encryption.ROTATED]} note(s), "
+            f"{self.totals[encryption.CURRENT]} already current, {self.totals[encryption.FAILED]} unreadable; "
+            f"{self.totals['scanned']} scanned in {elapsed:.1f}s ({rate:.0f} notes/s)."
+        )
+        if self.totals[encryption.FAILED]:
+            raise CommandError('Some notes could be decrypted with neither key; see the IDs above.')
+
+    @staticmethod
+    def ciphertexts(queryset):
+        # Read the stored ciphertext, not the value decrypted with the new key.
+        return queryset.annotate(
+            ciphertext=ExpressionWrapper(F('note_text'), output_field=models.BinaryField())
+        ).values_list('pk', 'ciphertext')
+
+    @staticmethod
+    def batches(rows, size):
+        batch = []
+        for pk, ciphertext in rows:
+            # memoryview (PostgreSQL) cannot be sent to another process.
+            batch.append((pk, bytes(ciphertext)))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def write_batch(self, batch, results):
+        read = dict(batch)
+        rotated = {pk: ciphertext for pk, ciphertext, status in results if status == encryption.ROTATED}
+        if rotated and not self.dry_run:
+            with transaction.atomic():
+                # Only overwrite notes that still hold the ciphertext that was
+                # re-encrypted. Anything saved since is already under the
+                # current key, and must not be replaced by the older text.
+                stored = self.ciphertexts(DoctorNote.objects.select_for_update().filter(pk__in=rotated))
+                unchanged = {pk for pk, ciphertext in stored if bytes(ciphertext) == read[pk]}
+                DoctorNote.objects.bulk_update([
+                    DoctorNote(pk=pk, note_text=Value(ciphertext, output_field=models.BinaryField()))
+                    for pk, ciphertext in rotated.items()
+                    if pk in unchanged
+                ], ['note_text'])
+            results = [
+                (pk, ciphertext, encryption.CURRENT if status == encryption.ROTATED and pk not in unchanged else status)
+                for pk, ciphertext, status in results
+            ]
+
+        for pk, _, status in results:
+            self.totals[status] += 1
+            if status == encryption.FAILED:
+                self.stderr.write(f'Cannot decrypt note {pk}.')
+        self.totals['scanned'] += len(results)
+
+        if not self.dry_run:
+            if self.checkpoint:
+                self.checkpoint.write_text(json.dumps({'last_pk': str(results[-1][0]), **self.totals}))
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f"{self.totals['scanned']} note(s) processed, {self.totals['scanned'] / elapsed:.0f} notes/s")
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hospital.services.stub import StubModel, make_stub_server
+
+
+class Command(BaseCommand):
+    help = (
+        'Serves a deterministic stand-in for the Gemini API on localhost. Point the '
+        'app at it with LLM_BASE_URL=http://HOST:PORT/v1beta/models to load test '
+        'the note pipeline without spending quota.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency', type=float, default=settings.LLM_STUB_LATENCY,
+                            help='Mean response time in seconds.')
+        parser.add_argument('--jitter', type=float, default=settings.LLM_STUB_JITTER,
+                            help='Uniform +/- spread around the latency, in seconds.')
+        parser.add_argument('--error-rate', type=float, default=settings.LLM_STUB_ERROR_RATE,
+                            help='Fraction of requests answered with 503.')
+        parser.add_argument('--rate-limit-rate', type=float, default=settings.LLM_STUB_RATE_LIMIT_RATE,
+                            help='Fraction of requests answered with 429 and Retry-After.')
+        parser.add_argument('--seed', type=int, default=settings.LLM_STUB_SEED)
+
+    def handle(self, *args, **options):
+        model = StubModel(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            seed=options['seed'],
+        )
+        server = make_stub_server(model, options['host'], options['port'])
+        self.stdout.write(
+            f"LLM stub listening on http://{options['host']}:{options['port']}/v1beta/models"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_next_check_at(apps, schema_editor):
+    # Hand active plans over to the periodic dispatcher on its next tick.
+    ActionableStep = apps.get_model('hospital', 'ActionableStep')
+    ActionableStep.objects.filter(
+        status='pending', step_type='plan', schedule__isnull=False
+    ).update(next_check_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0002_alter_doctornote_note_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionablestep',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='actionablestep',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['next_check_at'], name='step_pending_next_check_idx'),
+        ),
+        migrations.RunPython(backfill_next_check_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import datetime
+
+
+BATCH_SIZE = 500
+
+
+def _flush(StepScheduleEvent, ActionableStep, events, steps):
+    StepScheduleEvent.objects.bulk_create(events, ignore_conflicts=True)
+    ActionableStep.objects.bulk_update(steps, ['schedule'])
+    events.clear()
+    steps.clear()
+
+
+def move_dates_to_events(apps, schema_editor):
+    ActionableStep = apps.get_model('hospital', 'ActionableStep')
+    StepScheduleEvent = apps.get_model('hospital', 'StepScheduleEvent')
+
+    events, steps = [], []
+    queryset = ActionableStep.objects.filter(schedule__isnull=False).only('id', 'schedule')
+    for step in queryset.iterator(chunk_size=BATCH_SIZE):
+        schedule = step.schedule
+        if not isinstance(schedule, dict):
+            continue
+        for event_type, key in (('completed', 'completed_dates'), ('missed', 'missed_dates')):
+            for value in schedule.pop(key, None) or []:
+                recorded_at = datetime.fromisoformat(value)
+                events.append(StepScheduleEvent(
+                    step_id=step.id,
+                    event_type=event_type,
+                    date=recorded_at.date(),
+                    recorded_at=recorded_at,
+                ))
+        steps.append(step)
+        if len(steps) >= BATCH_SIZE:
+            _flush(StepScheduleEvent, ActionableStep, events, steps)
+    _flush(StepScheduleEvent, ActionableStep, events, steps)
+
+
+def move_events_to_dates(apps, schema_editor):
+    ActionableStep = apps.get_model('hospital', 'ActionableStep')
+    StepScheduleEvent = apps.get_model('hospital', 'StepScheduleEvent')
+
+    steps = []
+    queryset = ActionableStep.objects.filter(schedule__isnull=False).only('id', 'schedule')
+    for step in queryset.iterator(chunk_size=BATCH_SIZE):
+        schedule = step.schedule
+        if not isinstance(schedule, dict):
+            continue
+        schedule['completed_dates'], schedule['missed_dates'] = [], []
+        for event in StepScheduleEvent.objects.filter(step_id=step.id).order_by('recorded_at'):
+            schedule[f'{event.event_type}_dates'].append(event.recorded_at.isoformat())
+        steps.append(step)
+        if len(steps) >= BATCH_SIZE:
+            ActionableStep.objects.bulk_update(steps, ['schedule'])
+            steps.clear()
+    ActionableStep.objects.bulk_update(steps, ['schedule'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0003_actionablestep_next_check_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StepScheduleEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('completed', 'Completed'), ('missed', 'Missed')], max_length=10)),
+                ('date', models.DateField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('step', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_events', to='hospital.actionablestep')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stepscheduleevent',
+            constraint=models.UniqueConstraint(fields=('step', 'date', 'event_type'), name='unique_step_schedule_event'),
+        ),
+        migrations.RunPython(move_dates_to_events, move_events_to_dates),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_step_patient(apps, schema_editor):
+    ActionableStep = apps.get_model('hospital', 'ActionableStep')
+    DoctorNote = apps.get_model('hospital', 'DoctorNote')
+    ActionableStep.objects.update(
+        patient_id=models.Subquery(
+            DoctorNote.objects.filter(id=models.OuterRef('note_id')).values('patient_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hospital', '0004_stepscheduleevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionablestep',
+            name='patient',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='actionable_steps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_step_patient, migrations.RunPython.noop),
+    ]
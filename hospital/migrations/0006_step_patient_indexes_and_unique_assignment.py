@@ -0,0 +1,47 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicate_assignments(apps, schema_editor):
+    # Keep the earliest assignment for each (patient, doctor) pair.
+    DoctorPatientAssignment = apps.get_model('hospital', 'DoctorPatientAssignment')
+    duplicates = (
+        DoctorPatientAssignment.objects.values('patient_id', 'doctor_id')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for pair in duplicates:
+        ids = list(
+            DoctorPatientAssignment.objects.filter(
+                patient_id=pair['patient_id'], doctor_id=pair['doctor_id']
+            ).order_by('assigned_at', 'created_at').values_list('id', flat=True)
+        )
+        DoctorPatientAssignment.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hospital', '0005_actionablestep_patient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actionablestep',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actionable_steps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='actionablestep',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['patient', 'created_at'], name='step_pending_patient_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_assignments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='doctorpatientassignment',
+            constraint=models.UniqueConstraint(fields=('patient', 'doctor'), name='unique_patient_doctor_assignment'),
+        ),
+    ]
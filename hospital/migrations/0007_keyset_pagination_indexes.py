@@ -0,0 +1,29 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0006_step_patient_indexes_and_unique_assignment'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='actionablestep',
+            name='step_pending_patient_idx',
+        ),
+        migrations.AddIndex(
+            model_name='actionablestep',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['patient', 'created_at', 'id'], name='step_pending_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorpatientassignment',
+            index=models.Index(fields=['patient', 'created_at', 'id'], name='assignment_patient_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorpatientassignment',
+            index=models.Index(fields=['doctor', 'created_at', 'id'], name='assignment_doctor_page_idx'),
+        ),
+    ]
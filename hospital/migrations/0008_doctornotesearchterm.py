@@ -0,0 +1,29 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorNoteSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term_hash', models.CharField(max_length=64)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='hospital.doctornote')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term_hash', 'note'], name='note_search_term_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctornotesearchterm',
+            constraint=models.UniqueConstraint(fields=('note', 'term_hash'), name='unique_note_search_term'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:32
+
+from django.db import migrations, models
+
+
+def mark_existing_notes_done(apps, schema_editor):
+    # Notes created before this migration were already handed to the LLM;
+    # leaving them pending would let a stray redelivery process them again.
+    DoctorNote = apps.get_model('hospital', 'DoctorNote')
+    DoctorNote.objects.update(processing_status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0008_doctornotesearchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctornote',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctornote',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctornote',
+            name='processing_claim',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='doctornote',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctornote',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done')], default='pending', max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='doctornote',
+            constraint=models.UniqueConstraint(fields=('doctor', 'idempotency_key'), name='unique_doctor_note_idempotency_key'),
+        ),
+        migrations.RunPython(mark_existing_notes_done, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0009_doctornote_processing_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctornote',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
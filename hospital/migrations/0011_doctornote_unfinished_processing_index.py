@@ -0,0 +1,17 @@
+# Generated by Django 4.2.19 on 2026-10-17 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_doctornote_failed_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctornote',
+            index=models.Index(condition=models.Q(('processing_status__in', ['pending', 'processing'])), fields=['processing_status', 'processing_started_at'], name='note_unfinished_processing_idx'),
+        ),
+    ]
@@ -15,10 +15,41 @@ class DoctorPatientAssignment(BaseModel):
     )
     assigned_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient', 'doctor'], name='unique_patient_doctor_assignment'
+            ),
+        ]
+        indexes = [
+            # Keyset pagination of each side's assignment list
+            models.Index(fields=['patient', 'created_at', 'id'], name='assignment_patient_page_idx'),
+            models.Index(fields=['doctor', 'created_at', 'id'], name='assignment_doctor_page_idx'),
+        ]
+
     def __str__(self):
         return f"{self.patient.get_full_name()} assigned to {self.doctor.get_full_name()}"
 
+class DoctorNoteQuerySet(models.QuerySet):
+    def without_note_text(self):
+        """Skip loading, and therefore decrypting, the encrypted note body."""
+        return self.defer('note_text')
+
+
 class DoctorNote(BaseModel):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    PROCESSING_STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    objects = DoctorNoteQuerySet.as_manager()
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     doctor = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='doctor_notes'
@@ -27,9 +58,63 @@ class DoctorNote(BaseModel):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='patient_notes'
     )
     note_text = encrypt(models.TextField())
+    # Client-supplied Idempotency-Key, so a retried submission returns the
+    # note it already created
+    idempotency_key = models.CharField(max_length=255, blank=True, null=True)
+    # LLM extraction state; see hospital.tasks.claim_notes
+    processing_status = models.CharField(
+        max_length=10, choices=PROCESSING_STATUS_CHOICES, default=PENDING
+    )
+    processing_claim = models.CharField(max_length=255, blank=True, default='')
+    processing_started_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'idempotency_key'],
+                name='unique_doctor_note_idempotency_key',
+            ),
+        ]
+        indexes = [
+            # The requeue_stalled_notes sweep; done and failed notes are
+            # the bulk of the table and never match it
+            models.Index(
+                fields=['processing_status', 'processing_started_at'],
+                condition=models.Q(processing_status__in=['pending', 'processing']),
+                name='note_unfinished_processing_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Note by {self.doctor.email} for {self.patient.email}"
 
+class DoctorNoteSearchTerm(models.Model):
+    """
+    Blind keyword index of a note's encrypted text: one row per distinct
+    word, stored as a keyed HMAC so the plaintext never reaches the table.
+    Maintained by ``hospital.services.search.note_search_index``.
+    """
+
+    note = models.ForeignKey(
+        DoctorNote, on_delete=models.CASCADE, related_name='search_terms'
+    )
+    term_hash = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['note', 'term_hash'], name='unique_note_search_term'
+            ),
+        ]
+        indexes = [
+            # Lookup by term; includes note so matches are answered from the index
+            models.Index(fields=['term_hash', 'note'], name='note_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term_hash[:12]} in {self.note_id}"
+
 class ActionableStep(BaseModel):
     TYPE_CHOICES = (
         ('checklist', 'Checklist'),
@@ -46,10 +131,62 @@ class ActionableStep(BaseModel):
     note = models.ForeignKey(
         DoctorNote, on_delete=models.CASCADE, related_name='actionable_steps'
     )
+    # Denormalized from note.patient so reminder lookups need no join
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='actionable_steps'
+    )
     step_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     description = models.TextField()
     schedule = models.JSONField(blank=True, null=True)  # Store scheduling details (e.g., frequency, duration)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    next_check_at = models.DateTimeField(blank=True, null=True)  # When the reminder dispatcher should next look at this step
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_check_at'],
+                name='step_pending_next_check_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['patient', 'created_at', 'id'],
+                name='step_pending_patient_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.patient_id is None and self.note_id is not None:
+            self.patient_id = self.note.patient_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.step_type} - {self.description[:20]}..."
+
+class StepScheduleEvent(models.Model):
+    """A check-in or a missed day for a plan step, one row per step, type and date."""
+
+    COMPLETED = 'completed'
+    MISSED = 'missed'
+    EVENT_CHOICES = (
+        (COMPLETED, 'Completed'),
+        (MISSED, 'Missed'),
+    )
+
+    step = models.ForeignKey(
+        ActionableStep, on_delete=models.CASCADE, related_name='schedule_events'
+    )
+    event_type = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    date = models.DateField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['step', 'date', 'event_type'],
+                name='unique_step_schedule_event',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} on {self.date} for {self.step_id}"
@@ -2,7 +2,8 @@ from rest_framework import serializers
 from .models import DoctorNote, ActionableStep, DoctorPatientAssignment
 from account.serializers import UserSerializer
 from account.models import User
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import Http404
 
 # Serializer to display a patient's selected doctors
 class PatientDoctorAssignmentSerializer(serializers.ModelSerializer):
@@ -16,6 +17,7 @@ class PatientDoctorAssignmentSerializer(serializers.ModelSerializer):
 class DoctorPatientAssignmentSerializer(serializers.ModelSerializer):
     patient = UserSerializer(read_only=True)
     notes = serializers.SerializerMethodField()
+    note_count = serializers.SerializerMethodField()
 
     class Meta:
         model = DoctorPatientAssignment
@@ -23,10 +25,23 @@ class DoctorPatientAssignmentSerializer(serializers.ModelSerializer):
         exclude = ("is_deleted", 'doctor')
 
     def get_notes(self, obj):
-        doctor = obj.doctor
-        patient = obj.patient
-        notes_qs = DoctorNote.objects.filter(doctor=doctor, patient=patient)
-        return DoctorNoteSerializer(notes_qs, many=True, context=self.context).data
+        # Note bodies are encrypted; only decrypt them when explicitly requested.
+        include_note_text = self.context.get('include_note_text', False)
+        serializer_class = DoctorNoteSerializer if include_note_text else DoctorNoteSummarySerializer
+
+        # Use the notes prefetched by DoctorPatientListView when available.
+        notes = getattr(obj.patient, 'notes_by_doctor', None)
+        if notes is None:
+            notes = DoctorNote.objects.filter(doctor_id=obj.doctor_id, patient_id=obj.patient_id)
+            if not include_note_text:
+                notes = notes.without_note_text()
+        return serializer_class(notes, many=True, context=self.context).data
+
+    def get_note_count(self, obj):
+        note_count = getattr(obj, 'note_count', None)
+        if note_count is None:
+            note_count = DoctorNote.objects.filter(doctor_id=obj.doctor_id, patient_id=obj.patient_id).count()
+        return note_count
     
 
 # Serializer to select or deselect doctors for a patient
@@ -41,24 +56,35 @@ class DoctorSelectionActionSerializer(serializers.Serializer):
     )
 
     def create(self, validated_data):
-        doctor_ids = validated_data['doctor_ids']
+        doctor_ids = set(validated_data['doctor_ids'])
         action = validated_data['action']
         request = self.context.get('request')
         if not request:
             raise serializers.ValidationError("Request context is missing.")
         patient = request.user
 
-        # Process each doctor based on the action.
-        for doctor_id in doctor_ids:
-            # Ensure the doctor exists and has the proper role.
-            doctor = get_object_or_404(User, id=doctor_id, role='doctor')
+        with transaction.atomic():
+            # Ensure every doctor exists and has the proper role before writing
+            # anything. The rows stay locked until the assignments are saved, so
+            # a doctor cannot be deleted or lose the role in between.
+            found_ids = set(
+                User.objects.select_for_update()
+                .filter(id__in=doctor_ids, role='doctor')
+                .values_list('id', flat=True)
+            )
+            if found_ids != doctor_ids:
+                raise Http404("No doctor matches the given query.")
+
             if action == 'select':
-                DoctorPatientAssignment.objects.get_or_create(patient=patient, doctor=doctor)
+                DoctorPatientAssignment.objects.bulk_create(
+                    [DoctorPatientAssignment(patient=patient, doctor_id=doctor_id) for doctor_id in doctor_ids],
+                    ignore_conflicts=True,
+                )
             elif action == 'deselect':
-                DoctorPatientAssignment.objects.filter(patient=patient, doctor=doctor).delete()
+                DoctorPatientAssignment.objects.filter(patient=patient, doctor_id__in=doctor_ids).delete()
 
         # Return the updated list of assignments for the patient.
-        return DoctorPatientAssignment.objects.filter(patient=patient)
+        return DoctorPatientAssignment.objects.filter(patient=patient).select_related('doctor')
     
         
 class ActionableStepSerializer(serializers.ModelSerializer):
@@ -72,5 +98,15 @@ class DoctorNoteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DoctorNote
-        read_only_fields = ("created", "updated", "doctor")
-        exclude = ("is_deleted",)
+        read_only_fields = ("created", "updated", "doctor", "processing_status", "processed_at")
+        exclude = ("is_deleted", "idempotency_key", "processing_claim", "processing_started_at")
+
+
+class DoctorNoteSummarySerializer(serializers.ModelSerializer):
+    """Note metadata and steps without the encrypted body."""
+    actionable_steps = ActionableStepSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = DoctorNote
+        read_only_fields = ("created", "updated", "doctor", "processing_status", "processed_at")
+        exclude = ("is_deleted", "note_text", "idempotency_key", "processing_claim", "processing_started_at")
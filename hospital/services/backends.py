@@ -0,0 +1,110 @@
+import json
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .parsing import RESPONSE_SCHEMA
+
+
+class LLMBackend(ABC):
+    """
+    Wire format of an LLM provider.
+
+    ``LLMService`` owns prompting, caching, rate limiting, retries and
+    parsing; a backend only knows how to turn a prompt into an HTTP request
+    and how to get the generated text back out of the response. The
+    backend in use is chosen with the ``LLM_BACKEND`` setting.
+    """
+
+    model: str
+
+    @abstractmethod
+    def build_request(self, client: httpx.AsyncClient, prompt: str, stream: bool = False) -> httpx.Request:
+        """Build the HTTP request that sends ``prompt`` to the model."""
+
+    @abstractmethod
+    def response_text(self, data: Dict) -> str:
+        """Return the generated text of a complete (non-streamed) response."""
+
+    @abstractmethod
+    def stream_text(self, response: httpx.Response) -> AsyncIterator[str]:
+        """Yield generated text from a streamed response as it arrives."""
+
+    def transport(self) -> Optional[httpx.AsyncBaseTransport]:
+        """Transport for the HTTP client, or None to use the network."""
+        return None
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini ``generateContent``/``streamGenerateContent`` API."""
+
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = (base_url or settings.LLM_BASE_URL).rstrip("/")
+        self.model = model or settings.LLM_MODEL
+        self.api_key = api_key if api_key is not None else settings.GEMINY_FLASH_API_KEY
+
+    def request_body(self, prompt: str) -> Dict:
+        body = {
+            "contents": [{
+                "parts":[{"text": prompt}]
+            }]
+        }
+        if settings.LLM_JSON_MODE:
+            # Constrain the model to the schema instead of free-form text.
+            body["generationConfig"] = {
+                "responseMimeType": "application/json",
+                "responseSchema": RESPONSE_SCHEMA,
+            }
+        return body
+
+    def build_request(self, client: httpx.AsyncClient, prompt: str, stream: bool = False) -> httpx.Request:
+        if stream:
+            method, params = "streamGenerateContent", {"key": self.api_key, "alt": "sse"}
+        else:
+            method, params = "generateContent", {"key": self.api_key}
+        return client.build_request(
+            "POST",
+            f"{self.base_url}/{self.model}:{method}",
+            params=params,
+            json=self.request_body(prompt),
+        )
+
+    def response_text(self, data: Dict) -> str:
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+    async def stream_text(self, response: httpx.Response) -> AsyncIterator[str]:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[len("data:"):])
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    yield part.get("text", "")
+
+
+class StubBackend(GeminiBackend):
+    """
+    Gemini's wire format answered in process by a deterministic stub.
+
+    No request leaves the process, so the whole note pipeline can be load
+    tested without spending quota. Latency and error injection are set with
+    the ``LLM_STUB_*`` settings. To exercise real sockets instead, run
+    ``manage.py run_llm_stub`` and point ``GeminiBackend`` at it with
+    ``LLM_BASE_URL``.
+    """
+
+    def __init__(self, model=None, stub=None):
+        super().__init__(base_url="http://llm-stub/v1beta/models", model=model or "stub", api_key="")
+        self.stub = stub
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        from .stub import StubModel, StubTransport
+
+        return StubTransport(self.stub or StubModel.from_settings())
+
+
+def get_backend() -> LLMBackend:
+    """Instantiate the backend class named by ``LLM_BACKEND``."""
+    return import_string(settings.LLM_BACKEND)()
@@ -0,0 +1,84 @@
+from typing import List
+from django.conf import settings
+from django.core.cache import caches
+
+
+class NoteBatcher:
+    """
+    Redis-backed buffer that coalesces doctor note IDs into batches.
+
+    Notes are pushed onto a Redis list; a batch is flushed either as soon as
+    ``LLM_BATCH_SIZE`` notes are waiting or ``LLM_BATCH_WINDOW`` seconds
+    after the first note of a window arrived, whichever comes first.
+    Without a Redis-backed cache the batcher is unavailable and callers
+    should process notes one by one.
+    """
+
+    queue_key = "llm:batch:queue"
+    window_key = "llm:batch:window"
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def batch_size(self) -> int:
+        return settings.LLM_BATCH_SIZE
+
+    @property
+    def window(self) -> float:
+        return settings.LLM_BATCH_WINDOW
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _redis_client(self):
+        get_client = getattr(getattr(self.cache, "client", None), "get_client", None)
+        if get_client is None:
+            return None
+        return get_client(write=True)
+
+    def push(self, note_id: str) -> bool:
+        """
+        Buffer a note ID.
+
+        Returns:
+            False when no Redis connection is configured
+        """
+        client = self._redis_client()
+        if client is None:
+            return False
+        client.rpush(self.cache.make_key(self.queue_key), note_id)
+        return True
+
+    def pending(self) -> int:
+        client = self._redis_client()
+        if client is None:
+            return 0
+        return client.llen(self.cache.make_key(self.queue_key))
+
+    def claim_window(self) -> bool:
+        """Return True for the first note of a new batching window."""
+        return self.cache.add(self.window_key, 1, timeout=self.window)
+
+    def pop_batch(self) -> List[str]:
+        """Atomically remove and return up to ``batch_size`` buffered IDs."""
+        client = self._redis_client()
+        if client is None:
+            return []
+        # Close the window first: a note pushed from here on claims a new
+        # window and schedules its own flush, while one pushed before is
+        # still taken by this pop.
+        self.cache.delete(self.window_key)
+        key = self.cache.make_key(self.queue_key)
+        pipe = client.pipeline(transaction=True)
+        pipe.lrange(key, 0, self.batch_size - 1)
+        pipe.ltrim(key, self.batch_size, -1)
+        note_ids, _ = pipe.execute()
+        return [
+            note_id.decode() if isinstance(note_id, bytes) else note_id
+            for note_id in note_ids
+        ]
+
+
+note_batcher = NoteBatcher()
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Raised by django-redis cache calls and by raw client calls respectively.
+CACHE_ERRORS = (ConnectionInterrupted, RedisError)
+
+
+class LLMResultCache:
+    """
+    Content-addressed cache for parsed LLM extraction results.
+
+    Entries are keyed by a hash of the normalized note text, the prompt
+    version and the model name, so resubmitted or copy-forwarded notes are
+    served without a network round-trip. Every entry has a TTL; on Redis the
+    number of entries is additionally bounded by evicting the oldest keys
+    once ``LLM_CACHE_MAX_ENTRIES`` is exceeded.
+
+    The cache is an optimization only: when Redis cannot be reached, reads
+    are treated as misses and writes are skipped, and the extraction goes
+    ahead without it.
+    """
+
+    key_prefix = "llm:extract"
+    index_key = "llm:extract:index"
+    hits_key = "llm:extract:hits"
+    misses_key = "llm:extract:misses"
+
+    def __init__(self, alias: Optional[str] = None):
+        self.cache = caches[alias or settings.LLM_CACHE_ALIAS]
+        self.enabled = settings.LLM_CACHE_ENABLED
+        self.timeout = settings.LLM_CACHE_TTL
+        self.max_entries = settings.LLM_CACHE_MAX_ENTRIES
+
+    @staticmethod
+    def normalize(note_text: str) -> str:
+        return _WHITESPACE_RE.sub(" ", note_text).strip()
+
+    def make_key(self, note_text: str, prompt_version: str, model: str) -> str:
+        digest = hashlib.sha256(
+            "\x1f".join((prompt_version, model, self.normalize(note_text))).encode("utf-8")
+        ).hexdigest()
+        return f"{self.key_prefix}:{digest}"
+
+    def get(self, note_text: str, prompt_version: str, model: str) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """
+        Look up a cached extraction result.
+
+        Returns:
+            Tuple of (checklist_items, plan_items), or None on a miss
+        """
+        if not self.enabled:
+            return None
+        try:
+            value = self.cache.get(self.make_key(note_text, prompt_version, model))
+        except CACHE_ERRORS as e:
+            self._log_error("read", e)
+            return None
+        self._incr(self.hits_key if value is not None else self.misses_key)
+        if value is None:
+            return None
+        checklist_items, plan_items = value
+        return checklist_items, plan_items
+
+    def set(self, note_text: str, prompt_version: str, model: str, result: Tuple[List[Dict], List[Dict]]) -> None:
+        if not self.enabled:
+            return
+        key = self.make_key(note_text, prompt_version, model)
+        checklist_items, plan_items = result
+        try:
+            self.cache.set(key, [checklist_items, plan_items], timeout=self.timeout)
+            self._track(key)
+        except CACHE_ERRORS as e:
+            self._log_error("write", e)
+
+    def stats(self) -> Dict[str, int]:
+        values = self.cache.get_many([self.hits_key, self.misses_key])
+        return {
+            "hits": values.get(self.hits_key, 0),
+            "misses": values.get(self.misses_key, 0),
+        }
+
+    def _incr(self, key: str) -> None:
+        try:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # Counter does not exist yet (or the backend cannot store it).
+                self.cache.add(key, 1, timeout=None)
+        except CACHE_ERRORS as e:
+            self._log_error("counter", e)
+
+    @staticmethod
+    def _log_error(operation: str, error: Exception) -> None:
+        logger.warning("LLM result cache %s failed, continuing without it: %s", operation, type(error).__name__)
+
+    def _track(self, key: str) -> None:
+        """Record insertion order on Redis and evict the oldest overflow."""
+        client = self._redis_client()
+        if client is None or not self.max_entries:
+            return
+        index_key = self.cache.make_key(self.index_key)
+        pipe = client.pipeline()
+        pipe.zadd(index_key, {self.cache.make_key(key): time.time()})
+        pipe.zcard(index_key)
+        _, size = pipe.execute()
+        overflow = size - self.max_entries
+        if overflow > 0:
+            stale = client.zrange(index_key, 0, overflow - 1)
+            if stale:
+                pipe = client.pipeline()
+                pipe.delete(*stale)
+                pipe.zrem(index_key, *stale)
+                pipe.execute()
+
+    def _redis_client(self):
+        get_client = getattr(getattr(self.cache, "client", None), "get_client", None)
+        if get_client is None:
+            return None
+        return get_client(write=True)
@@ -0,0 +1,62 @@
+import hashlib
+import json
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+
+
+class DoctorDirectoryCache:
+    """
+    Versioned read-through cache for rendered doctor directory pages.
+
+    Every entry key embeds the current directory version, so bumping the
+    version (whenever a doctor is created, updated or deleted) invalidates
+    all cached pages at once without having to enumerate them. Each entry
+    stores the response data with a strong ETag derived from its content.
+    """
+
+    version_key = "hospital:doctor-directory:version"
+
+    def get_version(self) -> int:
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, timeout=None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def bump_version(self) -> None:
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 2, timeout=None)
+
+    def make_key(self, params: Dict[str, str]) -> str:
+        """
+        Build the entry key for a page from the parameters that select it.
+
+        Parameter order does not matter; callers pass only the parameters
+        the paginator honours, already normalized.
+        """
+        digest = hashlib.sha256(urlencode(sorted(params.items())).encode("utf-8")).hexdigest()
+        return f"hospital:doctor-directory:v{self.get_version()}:{digest}"
+
+    def get(self, key: str) -> Optional[Tuple[object, str]]:
+        return cache.get(key)
+
+    def set(self, key: str, data) -> Tuple[object, str]:
+        """
+        Store page data and return it with its ETag.
+
+        Returns:
+            Tuple of (data, etag)
+        """
+        body = json.dumps(data, sort_keys=True, default=str)
+        etag = '"%s"' % hashlib.md5(body.encode("utf-8")).hexdigest()
+        entry = (json.loads(body), etag)
+        # Pages hold signed media URLs, which must outlive the entry.
+        cache.set(key, entry, timeout=min(settings.DOCTOR_DIRECTORY_CACHE_TTL, settings.MEDIA_URL_TTL))
+        return entry
+
+
+doctor_directory_cache = DoctorDirectoryCache()
@@ -0,0 +1,93 @@
+from typing import Iterable, List, Optional, Tuple
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.core.signing import BadSignature
+from django.utils.encoding import force_bytes
+from django_cryptography.core.signing import FernetSigner
+from django_cryptography.utils.crypto import FernetBytes, InvalidToken
+
+ROTATED = "rotated"
+CURRENT = "current"
+FAILED = "failed"
+
+# Per-process ciphers of the rotation workers, set by ``init_rotation_worker``.
+_ciphers = {}
+
+
+def cipher_for(secret_key: str, cryptography_key: Optional[str] = None) -> FernetBytes:
+    """
+    Build the cipher django-cryptography would use under other settings.
+
+    Encrypted fields derive their AES key from ``CRYPTOGRAPHY_KEY`` (or
+    ``SECRET_KEY`` when unset) and sign with ``SECRET_KEY``, so both are
+    needed to read values written before a rotation.
+    """
+    digest = settings.CRYPTOGRAPHY_DIGEST
+    kdf = PBKDF2HMAC(
+        algorithm=digest,
+        length=digest.digest_size,
+        salt=settings.CRYPTOGRAPHY_SALT,
+        iterations=30000,
+        backend=settings.CRYPTOGRAPHY_BACKEND,
+    )
+    key = kdf.derive(force_bytes(cryptography_key or secret_key))
+    return FernetBytes(key, FernetSigner(secret_key))
+
+
+def current_note_cipher() -> FernetBytes:
+    from ..models import DoctorNote
+
+    return DoctorNote._meta.get_field("note_text")._fernet
+
+
+def cipher_key_material(cipher: FernetBytes) -> Tuple[bytes, bytes]:
+    """The derived encryption key and the signing key of ``cipher``."""
+    return cipher._encryption_key, cipher._signer.key
+
+
+def init_rotation_worker(
+    old_secret_key: str,
+    old_cryptography_key: Optional[str],
+    new_key_material: Tuple[bytes, bytes],
+) -> None:
+    """
+    Set up this process's ciphers for ``reencrypt``.
+
+    The current key is handed over by the parent rather than read from
+    settings: a spawned worker re-imports them, and would make up its own
+    SECRET_KEY if the environment does not set one.
+    """
+    import django
+
+    django.setup()
+    encryption_key, signing_key = new_key_material
+    _ciphers["old"] = cipher_for(old_secret_key, old_cryptography_key)
+    _ciphers["new"] = FernetBytes(encryption_key, FernetSigner(signing_key))
+
+
+def reencrypt(rows: Iterable[Tuple[object, bytes]]) -> List[Tuple[object, Optional[bytes], str]]:
+    """
+    Re-encrypt ciphertexts from the old key to the current one.
+
+    The decrypted payload is re-wrapped as is, without being unpickled.
+    Values already under the current key are left alone, so an interrupted
+    rotation can simply be run again.
+
+    Returns:
+        One (pk, new ciphertext or None, status) tuple per row
+    """
+    old, new = _ciphers["old"], _ciphers["new"]
+    results = []
+    for pk, ciphertext in rows:
+        ciphertext = bytes(ciphertext)
+        try:
+            results.append((pk, new.encrypt(old.decrypt(ciphertext)), ROTATED))
+            continue
+        except (BadSignature, InvalidToken):
+            pass
+        try:
+            new.decrypt(ciphertext)
+            results.append((pk, None, CURRENT))
+        except (BadSignature, InvalidToken):
+            results.append((pk, None, FAILED))
+    return results
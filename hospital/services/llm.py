@@ -1,79 +1,445 @@
-import json
+import asyncio
+import atexit
+import logging
+import os
+import random
+import threading
+import time
 import httpx
-from typing import Dict, List, Tuple
+from asgiref.sync import sync_to_async
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 from django.conf import settings
+from .cache import LLMResultCache
+from .metrics import llm_metrics
+from .backends import LLMBackend, get_backend
+from .parsing import StepStreamParser
+from .ratelimit import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever PROMPT_TEMPLATE (or the response schema) changes so cached
+# extractions are not reused.
+PROMPT_VERSION = "2"
+
+PROMPT_TEMPLATE = """
+        Analyze this doctor's note and extract two types of actionable items:
+        1. Checklist: One-time tasks that need to be done
+        2. Plan: Scheduled tasks that need to be repeated
+
+        Format the response as a JSON with two lists: "checklist" and "plan"
+        Each checklist item should have: "description"
+        Each plan item should have: "description", "frequency", "duration"
+
+        Doctor's Note:
+        {note_text}
+        """
+
+
+# Responses worth retrying: rate limited or a transient server-side failure.
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class LLMUnavailable(Exception):
+    """
+    The LLM API kept failing with retryable errors.
+
+    ``retry_after`` carries the server's requested delay in seconds, if it
+    sent one.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMExtractionFailed(Exception):
+    """
+    The LLM API answered, but not with anything usable: a non-retryable
+    HTTP error, a malformed payload, or text without any steps in it.
+
+    Raised instead of returning empty results, which would otherwise be
+    taken as "this note has no actionable steps".
+    """
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, but no shorter than ``retry_after``."""
+    ceiling = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+    return max(random.uniform(0, ceiling), retry_after or 0.0)
+
+
+class LLMClientPool:
+    """
+    Process-wide, lazily created HTTP client for the LLM endpoint.
+
+    httpx connections are bound to the event loop that opened them, and
+    ``async_to_sync`` spins up a fresh loop on every call. To keep TCP/TLS
+    connections alive between notes, the pool owns a private event loop
+    running on a daemon thread and executes all LLM coroutines on it.
+
+    That thread must be a real OS thread. Under gevent it would be a
+    greenlet, and its running loop would be visible to every task greenlet
+    and make Django refuse their ORM calls, so the pool refuses to start
+    in a monkey-patched process; run the ``llm`` queue on ``-P threads``
+    (or prefork) instead.
+    """
 
-class LLMService:
-    """Service class to handle interactions with Google's Gemini Flash API."""
-    
     def __init__(self):
-        self.api_key = settings.GEMINY_FLASH_API_KEY
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
-        self.model = "gemini-1.5-flash"
-    
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._client = None
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def _gevent_patched() -> bool:
+        try:
+            from gevent import monkey
+        except ImportError:
+            return False
+        return monkey.is_module_patched("threading")
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=get_backend().transport(),
+            http2=settings.LLM_HTTP2 and self._http2_available(),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.LLM_HTTP_TIMEOUT,
+                connect=settings.LLM_HTTP_CONNECT_TIMEOUT,
+            ),
+        )
+
+    def _ensure_started(self) -> None:
+        # A forked child (e.g. a prefork Celery worker) inherits the parent's
+        # attributes but not its loop thread, so start over in that case.
+        if self._loop is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+            if self._gevent_patched():
+                raise RuntimeError(
+                    "LLMClientPool cannot run in a gevent-patched process; "
+                    "run the llm queue with -P threads or prefork"
+                )
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="llm-client-pool", daemon=True
+            )
+            thread.start()
+            self._client = self._build_client()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        self._ensure_started()
+        return self._client
+
+    def run(self, coro):
+        """
+        Run a coroutine on the pool's event loop and block for its result.
+
+        Args:
+            coro: Coroutine that may use ``self.client``
+
+        Returns:
+            The coroutine's return value
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self) -> None:
+        """Close pooled connections and stop the event loop thread."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = self._thread = self._client = None
+                return
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+
+llm_client_pool = LLMClientPool()
+atexit.register(llm_client_pool.close)
+
+
+class LLMService:
+    """
+    Service class to extract actionable steps with an LLM.
+
+    The provider is pluggable (see ``LLM_BACKEND``); Google's Gemini Flash
+    API is the default.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, backend: Optional[LLMBackend] = None):
+        self.backend = backend or get_backend()
+        self.model = self.backend.model
+        self.client = client
+        self.cache = LLMResultCache()
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=self.backend.transport(),
+            timeout=httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT),
+        )
+
+    def extract_actionable_steps_sync(self, note_text: str) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Blocking variant of ``extract_actionable_steps`` that reuses the
+        process-wide pooled client instead of opening a new connection.
+        """
+        async def _extract():
+            self.client = llm_client_pool.client
+            return await self.extract_actionable_steps(note_text)
+
+        return llm_client_pool.run(_extract())
+
+    def extract_actionable_steps_batch_sync(
+        self, note_texts: List[str], return_exceptions: bool = False
+    ) -> List[Union[Tuple[List[Dict], List[Dict]], BaseException]]:
+        """Blocking variant of ``extract_actionable_steps_batch`` on the pooled client."""
+        async def _extract():
+            self.client = llm_client_pool.client
+            return await self.extract_actionable_steps_batch(note_texts, return_exceptions=return_exceptions)
+
+        return llm_client_pool.run(_extract())
+
+    async def extract_actionable_steps_batch(
+        self, note_texts: List[str], return_exceptions: bool = False
+    ) -> List[Union[Tuple[List[Dict], List[Dict]], BaseException]]:
+        """
+        Extract actionable steps for several notes concurrently.
+
+        At most ``LLM_BATCH_CONCURRENCY`` requests are in flight at once.
+
+        Args:
+            note_texts: The doctor's note texts to analyze
+            return_exceptions: Return a note's error in place of its result
+                instead of raising the first one
+
+        Returns:
+            List of (checklist_items, plan_items), in the order of ``note_texts``
+        """
+        semaphore = asyncio.Semaphore(settings.LLM_BATCH_CONCURRENCY)
+
+        async def _extract(note_text):
+            async with semaphore:
+                return await self.extract_actionable_steps(note_text)
+
+        return list(await asyncio.gather(
+            *(_extract(text) for text in note_texts), return_exceptions=return_exceptions
+        ))
+
     async def extract_actionable_steps(self, note_text: str) -> Tuple[List[Dict], List[Dict]]:
         """
         Extract actionable steps from doctor's notes using Gemini Flash.
-        
+
         Args:
             note_text: The doctor's note text to analyze
-            
+
         Returns:
             Tuple of (checklist_items, plan_items)
+
+        Raises:
+            LLMUnavailable: when retryable errors persist
+            LLMExtractionFailed: when the response cannot be used
         """
-        prompt = f"""
-        Analyze this doctor's note and extract two types of actionable items:
-        1. Checklist: One-time tasks that need to be done
-        2. Plan: Scheduled tasks that need to be repeated
-        
-        Format the response as a JSON with two lists: "checklist" and "plan"
-        Each checklist item should have: "description"
-        Each plan item should have: "description", "frequency", "duration"
-        
-        Doctor's Note:
-        {note_text}
+        cached = await sync_to_async(self.cache.get)(note_text, PROMPT_VERSION, self.model)
+        if cached is not None:
+            return cached
+
+        if self.client is not None:
+            result = await self._extract_actionable_steps(self.client, note_text)
+        else:
+            async with self._new_client() as client:
+                result = await self._extract_actionable_steps(client, note_text)
+
+        await sync_to_async(self.cache.set)(note_text, PROMPT_VERSION, self.model, result)
+        return result
+
+    async def stream_actionable_steps(self, note_text: str) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Stream actionable steps from the backend's streaming API (Gemini's
+        ``streamGenerateContent``).
+
+        Items are yielded as soon as the model has finished writing them, so
+        the first one arrives long before the full response is complete.
+        Cached extractions are replayed without calling the model. HTTP
+        errors are raised to the caller, as is ``LLMExtractionFailed`` when
+        the response held no usable steps.
+
+        Args:
+            note_text: The doctor's note text to analyze
+
+        Yields:
+            Tuples of (kind, item), ``kind`` being "checklist" or "plan"
         """
-        
+        cached = await sync_to_async(self.cache.get)(note_text, PROMPT_VERSION, self.model)
+        if cached is not None:
+            for kind, items in zip(("checklist", "plan"), cached):
+                for item in items:
+                    yield kind, item
+            return
+
+        result = {"checklist": [], "plan": []}
+        parser = StepStreamParser()
+        client = self.client or self._new_client()
+        prompt = PROMPT_TEMPLATE.format(note_text=note_text)
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.model}:generateContent",
-                    params={"key": self.api_key},
-                    json={
-                        "contents": [{
-                            "parts":[{"text": prompt}]
-                        }]
-                    }
+            async with llm_rate_limiter.slot():
+                response = await self._send(
+                    client, lambda: self.backend.build_request(client, prompt, stream=True), stream=True
                 )
-                response.raise_for_status()
-                
-                data = response.json()
-                text_response = data["candidates"][0]["content"]["parts"][0]["text"]
-                
-                # Extract the JSON portion from the response
                 try:
-                    extracted_data = json.loads(text_response)
-                except json.JSONDecodeError:
-                    # If the response isn't valid JSON, try to extract JSON-like content
-                    import re
-                    json_match = re.search(r'\{.*\}', text_response, re.DOTALL)
-                    if json_match:
-                        extracted_data = json.loads(json_match.group())
-                    else:
-                        # Fallback structure if no JSON found
-                        extracted_data = {
-                            "checklist": [],
-                            "plan": []
-                        }
-                
-                checklist_items = extracted_data.get("checklist", [])
-                plan_items = extracted_data.get("plan", [])
-                
-                return checklist_items, plan_items
-                
+                    response.raise_for_status()
+                    async for text in self.backend.stream_text(response):
+                        for kind, item in parser.feed(text):
+                            result[kind].append(item)
+                            yield kind, item
+                finally:
+                    await response.aclose()
+        finally:
+            if client is not self.client:
+                await client.aclose()
+
+        await sync_to_async(self._record_parse)(parser)
+        if self._unusable(parser, result):
+            await sync_to_async(self._record_error)("bad_responses", LLMExtractionFailed())
+            raise LLMExtractionFailed("LLM response contained no usable steps")
+
+        await sync_to_async(self.cache.set)(
+            note_text, PROMPT_VERSION, self.model, (result["checklist"], result["plan"])
+        )
+
+    async def _send(
+        self, client: httpx.AsyncClient, build_request: Callable[[], httpx.Request], stream: bool = False
+    ) -> httpx.Response:
+        """
+        Send a request under the shared rate limit, retrying transient failures.
+
+        429/5xx responses and transport errors are retried up to
+        ``LLM_MAX_RETRIES`` times with exponential backoff and full jitter,
+        never sooner than the server's ``Retry-After``. The caller must
+        already hold a ``llm_rate_limiter.slot()``; it is kept during
+        backoff, since releasing it would only let another worker hit the
+        same limit.
+
+        Raises:
+            LLMUnavailable: when retries are exhausted, or the server asks
+                to wait longer than ``LLM_RETRY_MAX_DELAY``
+        """
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await llm_rate_limiter.wait_for_token()
+            retry_after = None
+            try:
+                response = await client.send(build_request(), stream=stream)
+            except httpx.TransportError as e:
+                error = e
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                await response.aclose()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = httpx.HTTPStatusError(
+                    f"LLM API returned {response.status_code}", request=response.request, response=response
+                )
+
+            if attempt == settings.LLM_MAX_RETRIES or (
+                retry_after is not None and retry_after > settings.LLM_RETRY_MAX_DELAY
+            ):
+                await sync_to_async(self._record_error)("unavailable", error)
+                raise LLMUnavailable(
+                    f"LLM API unavailable after {attempt + 1} attempt(s)", retry_after=retry_after
+                ) from error
+
+            await sync_to_async(llm_metrics.incr)("retries")
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    async def _extract_actionable_steps(
+        self, client: httpx.AsyncClient, note_text: str
+    ) -> Tuple[List[Dict], List[Dict]]:
+        prompt = PROMPT_TEMPLATE.format(note_text=note_text)
+        try:
+            async with llm_rate_limiter.slot():
+                response = await self._send(client, lambda: self.backend.build_request(client, prompt))
+            response.raise_for_status()
+
+            text_response = self.backend.response_text(response.json())
+
         except httpx.HTTPError as e:
-            print(f"HTTP error occurred: {e}")
-            return [], []
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            return [], []
\ No newline at end of file
+            # The request URL carries the API key, so log the error type only.
+            await sync_to_async(self._record_error)("http_errors", e)
+            raise LLMExtractionFailed(f"LLM request failed: {type(e).__name__}") from None
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            await sync_to_async(self._record_error)("bad_responses", e)
+            raise LLMExtractionFailed(f"Malformed LLM response: {type(e).__name__}") from e
+
+        result = {"checklist": [], "plan": []}
+        parser = StepStreamParser()
+        for kind, item in parser.feed(text_response):
+            result[kind].append(item)
+        await sync_to_async(self._record_parse)(parser)
+        if self._unusable(parser, result):
+            await sync_to_async(self._record_error)("bad_responses", LLMExtractionFailed())
+            raise LLMExtractionFailed("LLM response contained no usable steps")
+        return result["checklist"], result["plan"]
+
+    @staticmethod
+    def _unusable(parser: StepStreamParser, result: Dict[str, List[Dict]]) -> bool:
+        # A complete JSON object with empty lists means "nothing to do"; a
+        # missing or truncated one that yielded nothing means we don't know.
+        return not parser.done and not any(result.values())
+
+    @staticmethod
+    def _record_parse(parser: StepStreamParser) -> None:
+        if parser.rejected:
+            llm_metrics.incr("items_rejected", parser.rejected)
+            logger.warning("Dropped %d LLM item(s) that failed validation", parser.rejected)
+        if parser.done:
+            llm_metrics.incr("parse_ok")
+        elif parser.started:
+            llm_metrics.incr("parse_truncated")
+            logger.warning("LLM response was truncated; kept the items completed before the cut")
+        else:
+            llm_metrics.incr("parse_failed")
+            logger.warning("LLM response contained no JSON object")
+
+    @staticmethod
+    def _record_error(metric: str, error: Exception) -> None:
+        llm_metrics.incr(metric)
+        llm_metrics.incr("errors")
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+        logger.warning("LLM request failed: %s (status %s)", type(error).__name__, status_code)
@@ -0,0 +1,28 @@
+import hashlib
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+
+def patient_lock_key(patient_id) -> int:
+    """Signed 64-bit key of a patient's advisory lock."""
+    digest = hashlib.blake2b(f"patient-steps:{patient_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def lock_patient(patient_id) -> None:
+    """
+    Serialize changes to one patient's actionable steps until the current
+    transaction ends.
+
+    Takes a transaction-level advisory lock on PostgreSQL, so nothing but
+    other step writers for the same patient waits on it. Other databases
+    row-lock the patient's user record instead (a no-op on SQLite, which
+    serializes writers anyway).
+    """
+    if not connection.in_atomic_block:
+        raise RuntimeError("lock_patient() must be called inside transaction.atomic().")
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [patient_lock_key(patient_id)])
+        return
+    list(get_user_model().objects.select_for_update().filter(pk=patient_id).values_list("pk", flat=True))
@@ -0,0 +1,52 @@
+import logging
+from typing import Dict
+from django.core.cache import cache
+from .cache import CACHE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class LLMMetrics:
+    """
+    Counters for LLM calls and response parsing.
+
+    Counters live in the shared cache, so every web and Celery process adds
+    to the same totals and ``stats()`` reports them for the whole
+    deployment. Metrics never break the request path: if the cache cannot
+    be reached, the increment is dropped.
+    """
+
+    key_prefix = "llm:metrics"
+    names = (
+        "parse_ok",
+        "parse_truncated",
+        "parse_failed",
+        "items_rejected",
+        "http_errors",
+        "retries",
+        "unavailable",
+        "bad_responses",
+        "errors",
+    )
+
+    def make_key(self, name: str) -> str:
+        return f"{self.key_prefix}:{name}"
+
+    def incr(self, name: str, delta: int = 1) -> None:
+        key = self.make_key(name)
+        try:
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # Counter does not exist yet (or the backend cannot store it).
+                if not cache.add(key, delta, timeout=None):
+                    cache.incr(key, delta)
+        except CACHE_ERRORS as e:
+            logger.debug("Dropped LLM metric %s: %s", name, type(e).__name__)
+
+    def stats(self) -> Dict[str, int]:
+        values = cache.get_many([self.make_key(name) for name in self.names])
+        return {name: values.get(self.make_key(name), 0) for name in self.names}
+
+
+llm_metrics = LLMMetrics()
@@ -0,0 +1,157 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+STEP_KINDS = ("checklist", "plan")
+
+# Structured-output schema sent to Gemini in JSON mode (OpenAPI subset).
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "checklist": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"description": {"type": "STRING"}},
+                "required": ["description"],
+            },
+        },
+        "plan": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "description": {"type": "STRING"},
+                    "frequency": {"type": "STRING"},
+                    "duration": {"type": "INTEGER"},
+                },
+                "required": ["description", "frequency", "duration"],
+            },
+        },
+    },
+    "required": ["checklist", "plan"],
+}
+
+# Accepted Python types per item field; anything else is dropped.
+# Durations may also arrive as strings like "7 days" outside JSON mode.
+STEP_FIELDS = {
+    "checklist": {"description": (str,)},
+    "plan": {"description": (str,), "frequency": (str,), "duration": (int, str)},
+}
+
+
+def validate_step(kind: str, item) -> Optional[Dict]:
+    """
+    Check an extracted item against ``STEP_FIELDS``.
+
+    Returns:
+        The item restricted to known fields, or None when it has no usable
+        description or a field has the wrong type
+    """
+    if not isinstance(item, dict):
+        return None
+    fields = STEP_FIELDS[kind]
+    step = {}
+    for name, types in fields.items():
+        if name not in item:
+            continue
+        value = item[name]
+        if isinstance(value, bool) or not isinstance(value, types):
+            return None
+        step[name] = value
+    if not step.get("description", "").strip():
+        return None
+    return step
+
+
+class StepStreamParser:
+    """
+    Incremental parser for the model's ``{"checklist": [...], "plan": [...]}``
+    response.
+
+    Text is fed in as it arrives and each checklist/plan item is returned as
+    soon as its closing brace has been seen, without waiting for (or
+    re-scanning) the rest of the document. Anything before the first ``{``,
+    such as a Markdown code fence, is skipped, and items that were complete
+    before a truncated ending are kept. Items failing ``validate_step``
+    are dropped and counted in ``rejected``.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.done = False
+        self.started = False
+        self.string_start = None
+        self.last_key = None
+        self.array_kind = None
+        self.item_start = None
+        self.rejected = 0
+
+    def feed(self, text: str) -> List[Tuple[str, Dict]]:
+        """
+        Consume the next chunk of response text.
+
+        Returns:
+            List of (kind, item) completed by this chunk, ``kind`` being
+            "checklist" or "plan"
+        """
+        self.buffer += text
+        items = []
+        while self.pos < len(self.buffer) and not self.done:
+            item = self._step(self.buffer[self.pos])
+            if item is not None:
+                items.append(item)
+            self.pos += 1
+        return items
+
+    def _step(self, char: str) -> Optional[Tuple[str, Dict]]:
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                if self.depth == 1:
+                    # A string directly inside the top-level object is a key
+                    # (or a scalar value, which is never followed by "[").
+                    self.last_key = json.loads(self.buffer[self.string_start:self.pos + 1])
+            return None
+
+        if not self.started:
+            if char == "{":
+                self.started = True
+                self.depth = 1
+            return None
+
+        if char == '"':
+            self.in_string = True
+            self.string_start = self.pos
+        elif char in "{[":
+            self.depth += 1
+            if self.depth == 2 and char == "[":
+                self.array_kind = self.last_key if self.last_key in STEP_KINDS else None
+            elif self.depth == 3 and char == "{" and self.array_kind is not None:
+                self.item_start = self.pos
+        elif char in "}]":
+            self.depth -= 1
+            if self.depth == 2 and self.item_start is not None:
+                raw = self.buffer[self.item_start:self.pos + 1]
+                self.item_start = None
+                try:
+                    step = validate_step(self.array_kind, json.loads(raw))
+                except ValueError:
+                    step = None
+                if step is None:
+                    # Skip a malformed item rather than the rest of the stream.
+                    self.rejected += 1
+                    return None
+                return self.array_kind, step
+            if self.depth == 1:
+                self.array_kind = None
+            elif self.depth == 0:
+                self.done = True
+        return None
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import uuid
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.core.cache import caches
+from asgiref.sync import sync_to_async
+
+# Refill the bucket from Redis' own clock so every worker agrees on "now".
+# Returns the number of seconds to wait before a token is available (0 when
+# one was taken).
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# Counting semaphore as a sorted set of leases scored by expiry time, so a
+# slot held by a crashed worker frees itself once its lease runs out.
+SEMAPHORE_ACQUIRE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local lease = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now + lease, ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(lease) + 1)
+    return 1
+end
+return 0
+"""
+
+
+class LLMRateLimiter:
+    """
+    Cluster-wide limits on calls to the LLM API, shared through Redis.
+
+    A token bucket caps the request rate at ``LLM_RATE_LIMIT_PER_MINUTE``
+    (with bursts of up to ``LLM_RATE_LIMIT_BURST``), and a lease-based
+    semaphore caps the number of requests in flight at
+    ``LLM_MAX_IN_FLIGHT`` across every web and Celery process. Without a
+    Redis-backed cache there is nothing to share the state through and
+    the limiter lets every call through.
+    """
+
+    bucket_key = "llm:ratelimit:bucket"
+    semaphore_key = "llm:ratelimit:in-flight"
+    poll_interval = 0.1
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _redis_client(self):
+        get_client = getattr(getattr(self.cache, "client", None), "get_client", None)
+        if get_client is None:
+            return None
+        return get_client(write=True)
+
+    @property
+    def lease(self) -> float:
+        # Long enough to cover every attempt and backoff of a single call.
+        return (settings.LLM_HTTP_TIMEOUT + settings.LLM_RETRY_MAX_DELAY) * (settings.LLM_MAX_RETRIES + 1)
+
+    def take_token(self) -> float:
+        """
+        Try to take a token from the bucket.
+
+        Returns:
+            0 when a token was taken, otherwise the seconds until one is due
+        """
+        client = self._redis_client()
+        if client is None or settings.LLM_RATE_LIMIT_PER_MINUTE <= 0:
+            return 0.0
+        wait = client.eval(
+            TOKEN_BUCKET_SCRIPT,
+            1,
+            self.cache.make_key(self.bucket_key),
+            settings.LLM_RATE_LIMIT_PER_MINUTE / 60.0,
+            max(settings.LLM_RATE_LIMIT_BURST, 1),
+        )
+        return float(wait)
+
+    def try_acquire_slot(self, token: str) -> bool:
+        client = self._redis_client()
+        if client is None or settings.LLM_MAX_IN_FLIGHT <= 0:
+            return True
+        return bool(client.eval(
+            SEMAPHORE_ACQUIRE_SCRIPT,
+            1,
+            self.cache.make_key(self.semaphore_key),
+            settings.LLM_MAX_IN_FLIGHT,
+            token,
+            self.lease,
+        ))
+
+    def release_slot(self, token: str) -> None:
+        client = self._redis_client()
+        if client is not None:
+            client.zrem(self.cache.make_key(self.semaphore_key), token)
+
+    async def wait_for_token(self) -> None:
+        """Sleep until the shared token bucket grants a request."""
+        while True:
+            wait = await sync_to_async(self.take_token)()
+            if not wait:
+                return
+            await asyncio.sleep(wait + random.uniform(0, self.poll_interval))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the ``LLM_MAX_IN_FLIGHT`` cluster-wide request slots."""
+        token = uuid.uuid4().hex
+        while not await sync_to_async(self.try_acquire_slot)(token):
+            await asyncio.sleep(random.uniform(self.poll_interval / 2, self.poll_interval * 2))
+        try:
+            yield
+        finally:
+            await sync_to_async(self.release_slot)(token)
+
+
+llm_rate_limiter = LLMRateLimiter()
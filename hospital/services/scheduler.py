@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import List, Optional
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from hospital.models import ActionableStep
+from hospital.models import ActionableStep, StepScheduleEvent
 
 import re
 
@@ -40,77 +42,162 @@ class SchedulerService:
             "duration": duration,
             "start_date": now.isoformat(),
             "end_date": (now + timedelta(days=duration)).isoformat(),
-            "completed_dates": [],
-            "missed_dates": []
         }
-    
+
     @staticmethod
-    def update_schedule(schedule: Dict, check_in_date: Optional[datetime] = None) -> Dict:
+    def record_check_in(step: ActionableStep, check_in_date: Optional[datetime] = None) -> ActionableStep:
         """
-        Update a schedule based on check-in status.
-        
+        Record a patient check-in for a plan step.
+
+        Check-ins and missed days live in StepScheduleEvent rather than in the
+        schedule JSON. Each missed day pushes the end date back by one day.
+
         Args:
-            schedule: The current schedule configuration
+            step: The plan step being checked in
             check_in_date: The date of check-in (defaults to now)
-            
+
         Returns:
-            Updated schedule configuration
+            The updated step
         """
         if check_in_date is None:
             check_in_date = timezone.now()
-            
-        schedule['completed_dates'].append(check_in_date.isoformat())
-        
-        # If there were any missed dates before this check-in, extend the end date
-        missed_count = len(schedule.get('missed_dates', []))
-        if missed_count > 0:
+
+        StepScheduleEvent.objects.bulk_create(
+            [StepScheduleEvent(
+                step=step,
+                event_type=StepScheduleEvent.COMPLETED,
+                date=check_in_date.date(),
+                recorded_at=check_in_date,
+            )],
+            ignore_conflicts=True,
+        )
+
+        # If there were any missed dates, extend the end date by that many days
+        schedule = step.schedule
+        missed_count = step.schedule_events.filter(event_type=StepScheduleEvent.MISSED).count()
+        start_date = datetime.fromisoformat(schedule['start_date'])
+        end_date = start_date + timedelta(days=int(schedule['duration']) + missed_count)
+        if end_date.isoformat() != schedule['end_date']:
+            schedule['end_date'] = end_date.isoformat()
+            step.save(update_fields=['schedule', 'updated_at'])
+        return step
+
+    @staticmethod
+    def check_steps(steps: List[ActionableStep], now: Optional[datetime] = None) -> List[ActionableStep]:
+        """
+        Run one reminder check for a batch of pending plan steps.
+
+        Marks steps completed once their schedule has ended, records a missed
+        day for daily plans without a check-in today, and sets
+        ``next_check_at`` for the next dispatcher pass. Check-ins are looked
+        up with a single indexed query and missed days are inserted in bulk;
+        the caller saves the steps.
+
+        Args:
+            steps: The ActionableSteps to check
+            now: The time of the check (defaults to now)
+
+        Returns:
+            The updated steps
+        """
+        if now is None:
+            now = timezone.now()
+        today = now.date()
+
+        checked_in = set(
+            StepScheduleEvent.objects.filter(
+                step__in=steps, date=today, event_type=StepScheduleEvent.COMPLETED
+            ).values_list('step_id', flat=True)
+        )
+        missed = []
+
+        for step in steps:
+            schedule = step.schedule
+            if step.status != 'pending' or not schedule:
+                step.next_check_at = None
+                continue
+
             end_date = datetime.fromisoformat(schedule['end_date'])
-            schedule['end_date'] = (end_date + timedelta(days=missed_count)).isoformat()
-            
-        return schedule
+            if now > end_date:
+                step.status = 'completed'
+                step.next_check_at = None
+                continue
+
+            # Check if today's reminder was missed
+            if schedule['frequency'] == 'daily' and step.id not in checked_in:
+                missed.append(StepScheduleEvent(
+                    step=step,
+                    event_type=StepScheduleEvent.MISSED,
+                    date=today,
+                    recorded_at=now,
+                ))
 
-@shared_task
+            # Schedule next check based on frequency
+            step.next_check_at = now + timedelta(days=1)  # Default to daily
+
+        StepScheduleEvent.objects.bulk_create(missed, ignore_conflicts=True)
+        return steps
+
+    @classmethod
+    def check_step(cls, step: ActionableStep, now: Optional[datetime] = None) -> ActionableStep:
+        """Run one reminder check for a single step. See ``check_steps``."""
+        cls.check_steps([step], now)
+        return step
+
+
+@shared_task(ignore_result=True)
+def dispatch_due_reminders() -> int:
+    """
+    Periodic dispatcher for plan reminders (run by celery beat).
+
+    Fetches pending steps whose ``next_check_at`` has passed in bounded,
+    row-locked batches and checks them in bulk, instead of keeping one
+    delayed broker message per active step.
+
+    Returns:
+        Number of steps processed
+    """
+    batch_size = settings.REMINDER_DISPATCH_BATCH_SIZE
+    processed = 0
+
+    for _ in range(settings.REMINDER_DISPATCH_MAX_BATCHES):
+        now = timezone.now()
+        with transaction.atomic():
+            steps = list(
+                ActionableStep.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_check_at__lte=now)
+                .order_by('next_check_at')[:batch_size]
+            )
+            SchedulerService.check_steps(steps, now)
+            for step in steps:
+                step.updated_at = now
+            ActionableStep.objects.bulk_update(
+                steps, ['status', 'next_check_at', 'updated_at']
+            )
+
+        processed += len(steps)
+        if len(steps) < batch_size:
+            break
+
+    return processed
+
+
+@shared_task(ignore_result=True)
 def schedule_check_reminder(step_id: str) -> None:
     """
-    Celery task to check if a reminder needs to be sent and schedule the next one.
-    
+    Celery task to run a single reminder check immediately.
+
+    Recurring checks are driven by ``dispatch_due_reminders``; this task no
+    longer re-enqueues itself and is kept so that messages already sitting
+    in the broker drain cleanly.
+
     Args:
         step_id: The ID of the ActionableStep to check
     """
     try:
         step = ActionableStep.objects.get(id=step_id)
-        if step.status != 'pending':
-            return
-            
-        schedule = step.schedule
-        if not schedule:
-            return
-            
-        now = timezone.now()
-        start_date = datetime.fromisoformat(schedule['start_date'])
-        end_date = datetime.fromisoformat(schedule['end_date'])
-        
-        if now > end_date:
-            step.status = 'completed'
-            step.save()
-            return
-            
-        # Check if today's reminder was missed
-        today = now.date()
-        if schedule['frequency'] == 'daily':
-            if today not in [datetime.fromisoformat(d).date() for d in schedule['completed_dates']]:
-                schedule['missed_dates'].append(now.isoformat())
-                step.schedule = schedule
-                step.save()
-        
-        # Schedule next check based on frequency
-        next_check = now + timedelta(days=1)  # Default to daily
-        schedule_check_reminder.apply_async(
-            args=[step_id],
-            eta=next_check
-        )
-        
     except ActionableStep.DoesNotExist:
-        pass  # Step was deleted or doesn't exist
-    except Exception as e:
-        print(f"Error in schedule_check_reminder: {e}")
\ No newline at end of file
+        return  # Step was deleted or doesn't exist
+
+    SchedulerService.check_step(step)
+    step.save(update_fields=['status', 'next_check_at', 'updated_at'])
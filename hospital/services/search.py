@@ -0,0 +1,99 @@
+import re
+import unicodedata
+from typing import Iterable, List, Set
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils.crypto import salted_hmac
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class NoteSearchIndex:
+    """
+    Keyword search over encrypted doctor notes without decrypting them.
+
+    Each distinct word of a note is normalized (case-folded, accents
+    stripped) and stored as an HMAC in ``DoctorNoteSearchTerm``. The HMAC
+    key is derived for this purpose alone from ``NOTE_SEARCH_KEY`` (or
+    ``SECRET_KEY`` when unset), so no other signature made with the same
+    secret can be matched against the index. A query is hashed the same
+    way and answered with an indexed equality lookup, so only whole words
+    match. Changing the key invalidates every stored hash; rebuild with
+    ``manage.py rebuild_note_search_index``.
+    """
+
+    min_term_length = 2
+    key_salt = "hospital.note_search"
+
+    def tokenize(self, text: str) -> Set[str]:
+        text = unicodedata.normalize("NFKD", text or "").casefold()
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        return {term for term in _WORD_RE.findall(text) if len(term) >= self.min_term_length}
+
+    def hash_term(self, term: str) -> str:
+        secret = settings.NOTE_SEARCH_KEY or settings.SECRET_KEY
+        return salted_hmac(self.key_salt, term, secret=secret, algorithm="sha256").hexdigest()
+
+    def hash_text(self, text: str) -> List[str]:
+        return sorted(self.hash_term(term) for term in self.tokenize(text))
+
+    def index_note(self, note, created: bool = False) -> None:
+        """Replace the stored terms of ``note`` with those of its current text."""
+        from ..models import DoctorNoteSearchTerm
+
+        rows = [
+            DoctorNoteSearchTerm(note_id=note.pk, term_hash=term_hash)
+            for term_hash in self.hash_text(note.note_text)
+        ]
+        if created:
+            # A new note has no terms yet; one insert on the request path.
+            DoctorNoteSearchTerm.objects.bulk_create(rows)
+            return
+        with transaction.atomic():
+            DoctorNoteSearchTerm.objects.filter(note_id=note.pk).delete()
+            DoctorNoteSearchTerm.objects.bulk_create(rows)
+
+    def index_notes(self, notes: Iterable) -> int:
+        """
+        Rebuild the terms of many notes with one delete and one insert.
+
+        Returns:
+            Number of term rows written
+        """
+        from ..models import DoctorNoteSearchTerm
+
+        notes = list(notes)
+        rows = [
+            DoctorNoteSearchTerm(note_id=note.pk, term_hash=term_hash)
+            for note in notes
+            for term_hash in self.hash_text(note.note_text)
+        ]
+        with transaction.atomic():
+            DoctorNoteSearchTerm.objects.filter(note_id__in=[note.pk for note in notes]).delete()
+            DoctorNoteSearchTerm.objects.bulk_create(rows)
+        return len(rows)
+
+    def matching_note_ids(self, query: str):
+        """
+        IDs of notes containing every word of ``query``.
+
+        Returns:
+            A values queryset usable as an ``id__in`` subquery (empty when
+            the query has no indexable words)
+        """
+        from ..models import DoctorNoteSearchTerm
+
+        hashes = self.hash_text(query)
+        if not hashes:
+            return DoctorNoteSearchTerm.objects.none().values("note_id")
+        return (
+            DoctorNoteSearchTerm.objects.filter(term_hash__in=hashes)
+            .values("note_id")
+            .annotate(matched=Count("term_hash"))
+            .filter(matched=len(hashes))
+            .values("note_id")
+        )
+
+
+note_search_index = NoteSearchIndex()
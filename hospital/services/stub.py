@@ -0,0 +1,188 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import httpx
+from django.conf import settings
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+")
+_RECURRING_RE = re.compile(r"\b(daily|every|each|weekly|twice|nightly|times a)\b", re.IGNORECASE)
+_WEEKLY_RE = re.compile(r"\b(weekly|every week|each week)\b", re.IGNORECASE)
+_DURATION_RE = re.compile(r"\bfor (\d+) (day|week)s?\b", re.IGNORECASE)
+_NOTE_MARKER = "Doctor's Note:"
+
+
+class StubModel:
+    """
+    Deterministic stand-in for the LLM used for offline load tests.
+
+    Each sentence of the note becomes one item: sentences that mention a
+    recurrence ("daily", "every", ...) become plan items, the rest
+    checklist items. The same note always produces the same answer.
+    Latency and failures are injected from a seeded RNG, so a benchmark
+    run can be reproduced exactly.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        chunk_size: int = 64,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "StubModel":
+        return cls(
+            latency=settings.LLM_STUB_LATENCY,
+            jitter=settings.LLM_STUB_JITTER,
+            error_rate=settings.LLM_STUB_ERROR_RATE,
+            rate_limit_rate=settings.LLM_STUB_RATE_LIMIT_RATE,
+            seed=settings.LLM_STUB_SEED,
+        )
+
+    @staticmethod
+    def extract(note_text: str) -> Dict[str, List[Dict]]:
+        result = {"checklist": [], "plan": []}
+        for sentence in _SENTENCE_RE.findall(note_text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if _RECURRING_RE.search(sentence):
+                duration = _DURATION_RE.search(sentence)
+                days = 7
+                if duration:
+                    days = int(duration.group(1)) * (7 if duration.group(2).lower() == "week" else 1)
+                result["plan"].append({
+                    "description": sentence,
+                    "frequency": "weekly" if _WEEKLY_RE.search(sentence) else "daily",
+                    "duration": days,
+                })
+            else:
+                result["checklist"].append({"description": sentence})
+        return result
+
+    def roll(self) -> Tuple[float, Optional[int]]:
+        """
+        Draw this request's latency and injected failure.
+
+        Returns:
+            Tuple of (delay in seconds, HTTP status to fail with or None)
+        """
+        with self.lock:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+    def respond(self, path: str, body: bytes) -> Tuple[int, Dict[str, str], List[bytes]]:
+        """
+        Answer a Gemini-style request.
+
+        Returns:
+            Tuple of (status, headers, body chunks)
+        """
+        try:
+            prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return 400, {"Content-Type": "application/json"}, [b'{"error": "bad request"}']
+        note_text = prompt.split(_NOTE_MARKER, 1)[-1].strip()
+        text = json.dumps(self.extract(note_text))
+
+        if ":streamGenerateContent" in path:
+            chunks = [
+                b"data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": text[i:i + self.chunk_size]}]}}]}).encode() + b"\r\n\r\n"
+                for i in range(0, len(text), self.chunk_size)
+            ]
+            return 200, {"Content-Type": "text/event-stream"}, chunks
+        payload = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+        return 200, {"Content-Type": "application/json"}, [json.dumps(payload).encode()]
+
+    @staticmethod
+    def error_response(status: int) -> Tuple[int, Dict[str, str], List[bytes]]:
+        headers = {"Content-Type": "application/json"}
+        if status == 429:
+            headers["Retry-After"] = "1"
+        return status, headers, [json.dumps({"error": {"code": status}}).encode()]
+
+
+class _ChunkStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: List[bytes], delay: float):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            # Spread the generation time over the chunks like a real stream.
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """httpx transport that answers requests from a ``StubModel`` in process."""
+
+    def __init__(self, model: StubModel):
+        self.model = model
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        delay, failure = self.model.roll()
+        if failure is not None:
+            await asyncio.sleep(delay)
+            status, headers, chunks = self.model.error_response(failure)
+            return httpx.Response(status, headers=headers, content=b"".join(chunks))
+
+        status, headers, chunks = self.model.respond(request.url.path, await request.aread())
+        if len(chunks) == 1:
+            await asyncio.sleep(delay)
+            return httpx.Response(status, headers=headers, content=chunks[0])
+        return httpx.Response(status, headers=headers, stream=_ChunkStream(chunks, delay / len(chunks)))
+
+
+def make_stub_server(model: StubModel, host: str = "127.0.0.1", port: int = 8081) -> ThreadingHTTPServer:
+    """Build a localhost HTTP server that speaks Gemini's API from ``model``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            delay, failure = model.roll()
+            if failure is not None:
+                time.sleep(delay)
+                status, headers, chunks = model.error_response(failure)
+            else:
+                status, headers, chunks = model.respond(self.path, body)
+                if len(chunks) == 1:
+                    time.sleep(delay)
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+            self.end_headers()
+            for chunk in chunks:
+                if len(chunks) > 1:
+                    time.sleep(delay / len(chunks))
+                self.wfile.write(chunk)
+                self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
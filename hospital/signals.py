@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DoctorNote
+from .services.directory import doctor_directory_cache
+from .services.search import note_search_index
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    """Bump the doctor directory cache version when a doctor changes."""
+    if 'doctor' in (instance.role, getattr(instance, '_loaded_role', None)):
+        transaction.on_commit(doctor_directory_cache.bump_version)
+
+
+@receiver(post_save, sender=DoctorNote)
+def index_doctor_note(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the blind keyword index in step with the note text."""
+    if update_fields is not None and 'note_text' not in update_fields:
+        return
+    if 'note_text' in instance.get_deferred_fields():
+        return
+    note_search_index.index_note(instance, created=created)
@@ -1,56 +1,361 @@
+import uuid
+from datetime import timedelta
+from typing import List, Optional, Tuple
 from celery import shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_celery_results.models import GroupResult, TaskResult
 from .models import DoctorNote, ActionableStep
-from .services.llm import LLMService
-from .services.scheduler import SchedulerService, schedule_check_reminder
+from .services.batching import note_batcher
+from .services.llm import LLMExtractionFailed, LLMService, LLMUnavailable, llm_client_pool
+from .services.locks import lock_patient
+from .services.scheduler import SchedulerService
 
-from asgiref.sync import async_to_sync
 
-@shared_task
-def process_doctor_note(note_id: str) -> None:
+@worker_process_shutdown.connect
+def close_llm_client_pool(**kwargs):
+    """Release pooled LLM connections when a worker process exits."""
+    llm_client_pool.close()
+
+
+def cancel_pending_steps(patient) -> None:
+    """Cancel previous pending actionable steps for this patient."""
+    ActionableStep.objects.filter(
+        patient=patient,
+        status='pending'
+    ).update(status='cancelled')
+
+
+def save_actionable_steps(note: DoctorNote, checklist_items, plan_items) -> None:
+    """
+    Persist extracted items for a note and schedule plan reminders.
+
+    All steps are written with a single bulk INSERT. Plan steps get a
+    ``next_check_at`` one day out and are picked up by the periodic
+    ``dispatch_due_reminders`` task from then on.
+    """
+    scheduler_service = SchedulerService()
+    first_check_at = timezone.now() + timedelta(days=1)
+
+    # Checklist items (one-time tasks)
+    steps = [
+        ActionableStep(
+            note=note,
+            patient_id=note.patient_id,
+            step_type='checklist',
+            description=item['description'],
+        )
+        for item in checklist_items
+    ]
+
+    # Plan items (scheduled tasks)
+    steps += [
+        ActionableStep(
+            note=note,
+            patient_id=note.patient_id,
+            step_type='plan',
+            description=item['description'],
+            schedule=scheduler_service.create_schedule(
+                frequency=item.get('frequency', 'daily'),
+                duration=item.get('duration', 7)
+            ),
+            next_check_at=first_check_at,
+        )
+        for item in plan_items
+    ]
+
+    ActionableStep.objects.bulk_create(steps)
+
+
+def claim_notes(note_ids: List[str], claim: Optional[str] = None) -> List[DoctorNote]:
+    """
+    Mark notes as being processed by the caller.
+
+    A note can be claimed while it is pending, when ``claim`` already holds
+    it (a redelivery of the same task message after its worker died), or
+    when another claim has outlived ``NOTE_PROCESSING_TIMEOUT``. Notes that
+    are done, deleted or held by a live claim are skipped, so duplicate
+    deliveries return without calling the LLM.
+
+    Returns:
+        The claimed notes, oldest first, with ``patient`` loaded
+    """
+    claim = claim or uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.NOTE_PROCESSING_TIMEOUT)
+    claimable = (
+        Q(processing_status=DoctorNote.PENDING)
+        | Q(processing_status=DoctorNote.PROCESSING, processing_claim=claim)
+        | Q(processing_status=DoctorNote.PROCESSING, processing_started_at__lt=stale)
+    )
+    with transaction.atomic():
+        notes = list(
+            DoctorNote.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('patient')
+            .filter(claimable, id__in=note_ids)
+            .order_by('created_at')
+        )
+        DoctorNote.objects.filter(id__in=[note.id for note in notes]).update(
+            processing_status=DoctorNote.PROCESSING,
+            processing_claim=claim,
+            processing_started_at=now,
+        )
+    for note in notes:
+        note.processing_status = DoctorNote.PROCESSING
+        note.processing_claim = claim
+        note.processing_started_at = now
+    return notes
+
+
+def release_notes(notes: List[DoctorNote]) -> None:
+    """Give claimed notes back, e.g. before a retry, so they can be claimed again."""
+    for note in notes:
+        DoctorNote.objects.filter(
+            id=note.id,
+            processing_status=DoctorNote.PROCESSING,
+            processing_claim=note.processing_claim,
+        ).update(processing_status=DoctorNote.PENDING, processing_claim='')
+
+
+def fail_notes(notes: List[DoctorNote]) -> None:
+    """
+    Give up on claimed notes whose extraction keeps failing.
+
+    The patient's pending steps are left as they are, and failed notes are
+    not picked up again by ``claim_notes``.
+    """
+    for note in notes:
+        DoctorNote.objects.filter(
+            id=note.id,
+            processing_status=DoctorNote.PROCESSING,
+            processing_claim=note.processing_claim,
+        ).update(processing_status=DoctorNote.FAILED, processed_at=timezone.now())
+
+
+def complete_note(note: DoctorNote, checklist_items, plan_items) -> bool:
+    """
+    Replace the patient's pending steps with a claimed note's steps.
+
+    Runs under the patient's lock, so notes for one patient are applied one
+    at a time. When a newer note of the patient has already been applied,
+    this note's steps are dropped rather than overwriting the newer ones.
+
+    Returns:
+        False if the claim was lost (taken over after timing out) and
+        nothing was written
+    """
+    with transaction.atomic():
+        lock_patient(note.patient_id)
+        completed = DoctorNote.objects.filter(
+            id=note.id,
+            processing_status=DoctorNote.PROCESSING,
+            processing_claim=note.processing_claim,
+        ).update(processing_status=DoctorNote.DONE, processed_at=timezone.now())
+        if not completed:
+            return False
+        superseded = DoctorNote.objects.filter(
+            patient_id=note.patient_id,
+            processing_status=DoctorNote.DONE,
+            created_at__gt=note.created_at,
+        ).exists()
+        if not superseded:
+            cancel_pending_steps(note.patient)
+            save_actionable_steps(note, checklist_items, plan_items)
+    return True
+
+
+# Celery-level retry policy for LLM outages that outlast the in-process
+# retries in LLMService, and for unusable responses, which a later call may
+# get right. Nothing reads these tasks' return values, so no result is stored.
+LLM_TASK_RETRY_OPTIONS = dict(
+    ignore_result=True,
+    autoretry_for=(LLMUnavailable, LLMExtractionFailed),
+    retry_backoff=30,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=8,
+)
+
+
+def retry_after_llm_backoff(task, error: LLMUnavailable):
+    """
+    Retry ``task`` no sooner than the LLM API's ``Retry-After``, if it sent
+    one, capped at ``LLM_RETRY_AFTER_MAX`` so the broker does not redeliver
+    the waiting message as well.
+    """
+    if error.retry_after:
+        raise task.retry(exc=error, countdown=min(error.retry_after, settings.LLM_RETRY_AFTER_MAX))
+    raise error
+
+
+def handle_extraction_errors(task, failures: List[Tuple[DoctorNote, BaseException]]):
+    """
+    Hand back claimed notes whose extraction failed, and re-raise.
+
+    Notes are released for the retry, except those whose responses were
+    still unusable once the task's retries ran out: they are marked failed
+    instead. Any other error is raised in preference to an unusable
+    response, so an outage is retried rather than failing the task.
+    """
+    exhausted = task.request.retries >= task.max_retries
+    given_up = [note for note, error in failures if exhausted and isinstance(error, LLMExtractionFailed)]
+    fail_notes(given_up)
+    release_notes([note for note, _ in failures if note not in given_up])
+
+    error = next(
+        (error for _, error in failures if not isinstance(error, LLMExtractionFailed)), failures[0][1]
+    )
+    if isinstance(error, LLMUnavailable):
+        retry_after_llm_backoff(task, error)
+    raise error
+
+
+@shared_task(bind=True, **LLM_TASK_RETRY_OPTIONS)
+def process_doctor_note(self, note_id: str) -> None:
     """
     Process a doctor's note to extract actionable steps via LLM integration.
     Cancels any previous pending actionable steps for the patient.
+
+    Safe to deliver more than once: the note is claimed before the LLM is
+    called, and deliveries that find it done or claimed exit right away.
+
+    The patient's current steps are only replaced once extraction has
+    succeeded, so a rate-limited call or an unusable response that is
+    retried later leaves them untouched in the meantime.
     """
-    try:
-        note = DoctorNote.objects.get(id=note_id)
-    except DoctorNote.DoesNotExist:
+    notes = claim_notes([note_id], claim=self.request.id)
+    if not notes:
+        # Already processed, deleted, or being processed by another delivery.
         return
-
-    # Cancel previous pending actionable steps for this patient
-    ActionableStep.objects.filter(
-        note__patient=note.patient, 
-        status='pending'
-    ).update(status='cancelled')
+    note = notes[0]
 
     llm_service = LLMService()
-    scheduler_service = SchedulerService()
     
-    # Synchronously call the asynchronous method
-    checklist_items, plan_items = async_to_sync(llm_service.extract_actionable_steps)(note.note_text)
+    # Reuse the worker's pooled HTTP client rather than opening one per note
+    try:
+        checklist_items, plan_items = llm_service.extract_actionable_steps_sync(note.note_text)
+    except BaseException as e:
+        handle_extraction_errors(self, [(note, e)])
     
-    with transaction.atomic():
-        # Create checklist items (one-time tasks)
-        for item in checklist_items:
-            ActionableStep.objects.create(
-                note=note,
-                step_type='checklist',
-                description=item['description'],
-            )
-        
-        # Create plan items (scheduled tasks)
-        for item in plan_items:
-            schedule = scheduler_service.create_schedule(
-                frequency=item.get('frequency', 'daily'),
-                duration=item.get('duration', 7)
-            )
-            
-            step = ActionableStep.objects.create(
-                note=note,
-                step_type='plan',
-                description=item['description'],
-                schedule=schedule
+    complete_note(note, checklist_items, plan_items)
+
+
+@shared_task(bind=True, **LLM_TASK_RETRY_OPTIONS)
+def process_doctor_note_batch(self, note_ids: List[str]) -> None:
+    """
+    Process several doctor's notes with one round of concurrent LLM calls.
+
+    Notes are handled oldest first so that, when a batch holds more than one
+    note for the same patient, the latest note's steps are the ones left
+    pending. Notes whose extraction succeeded are completed even when others
+    in the batch failed; only the failed ones are retried.
+    """
+    notes = claim_notes(note_ids, claim=self.request.id)
+    if not notes:
+        return
+
+    # Notes that were extracted before a failure are cached, so a retry
+    # only pays for the ones that are still missing.
+    try:
+        results = LLMService().extract_actionable_steps_batch_sync(
+            [note.note_text for note in notes], return_exceptions=True
+        )
+    except BaseException as e:
+        handle_extraction_errors(self, [(note, e) for note in notes])
+
+    failures = []
+    for note, result in zip(notes, results):
+        if isinstance(result, BaseException):
+            failures.append((note, result))
+        else:
+            complete_note(note, *result)
+    # A retry claims the notes again, and finds the completed ones done.
+    if failures:
+        handle_extraction_errors(self, failures)
+
+
+@shared_task(ignore_result=True)
+def flush_doctor_note_batch() -> None:
+    """Drain up to one batch of buffered note IDs and process them together."""
+    note_ids = note_batcher.pop_batch()
+    if note_ids:
+        # Dispatched as its own task so a rate-limited batch can be retried
+        # after the IDs have left the buffer.
+        process_doctor_note_batch.delay(note_ids)
+    if note_batcher.pending():
+        flush_doctor_note_batch.delay()
+
+
+def enqueue_doctor_note(note_id: str) -> None:
+    """
+    Hand a note over for LLM processing, coalescing it into a batch when
+    batching is enabled and a Redis buffer is available.
+    """
+    if not settings.LLM_BATCH_ENABLED or not note_batcher.push(note_id):
+        process_doctor_note.delay(note_id)
+        return
+
+    if note_batcher.pending() >= note_batcher.batch_size:
+        flush_doctor_note_batch.delay()
+    elif note_batcher.claim_window():
+        flush_doctor_note_batch.apply_async(countdown=note_batcher.window)
+
+
+@shared_task(ignore_result=True)
+def requeue_stalled_notes() -> int:
+    """
+    Re-enqueue notes whose processing was lost.
+
+    Picks up notes still claimed past ``NOTE_PROCESSING_TIMEOUT`` (e.g. a
+    streamed note whose web worker died mid-request), and notes that are
+    pending but have not been claimed for as long (e.g. because Celery
+    gave up retrying an LLM outage). Deliveries are idempotent, so a note
+    that is still on its way only costs an extra, skipped task.
+
+    Returns:
+        Number of notes re-enqueued
+    """
+    stale = timezone.now() - timedelta(seconds=settings.NOTE_PROCESSING_TIMEOUT)
+    stalled = (
+        Q(processing_status=DoctorNote.PROCESSING, processing_started_at__lt=stale)
+        | Q(processing_status=DoctorNote.PENDING, created_at__lt=stale, processing_started_at__isnull=True)
+        | Q(processing_status=DoctorNote.PENDING, processing_started_at__lt=stale)
+    )
+    note_ids = list(
+        DoctorNote.objects.filter(stalled, is_deleted=False)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:settings.NOTE_REQUEUE_BATCH_SIZE]
+    )
+    for note_id in note_ids:
+        enqueue_doctor_note(str(note_id))
+    return len(note_ids)
+
+
+@shared_task(ignore_result=True)
+def prune_task_results() -> int:
+    """
+    Delete stored Celery results older than ``TASK_RESULT_RETENTION``.
+
+    Celery's own ``backend_cleanup`` only expires the configured result
+    backend, so rows left in the database backend's tables are removed here,
+    in small batches to keep each delete's locks short.
+
+    Returns:
+        Number of rows deleted
+    """
+    cutoff = timezone.now() - settings.TASK_RESULT_RETENTION
+    batch_size = settings.TASK_RESULT_PRUNE_BATCH_SIZE
+    deleted = 0
+    for model in (TaskResult, GroupResult):
+        while True:
+            pks = list(
+                model.objects.filter(date_done__lt=cutoff)
+                .values_list('pk', flat=True)[:batch_size]
             )
-            
-            # Schedule the reminder task
-            schedule_check_reminder.delay(str(step.id))
\ No newline at end of file
+            if not pks:
+                break
+            deleted += model.objects.filter(pk__in=pks).delete()[0]
+    return deleted
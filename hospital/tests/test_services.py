@@ -0,0 +1,1181 @@
+import json
+import os
+import pickle
+import subprocess
+import sys
+import threading
+from importlib.util import find_spec
+from unittest import skipUnless
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.exceptions import ConnectionInterrupted
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import BinaryField, Value
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.asyncio import async_unsafe
+from django.utils import timezone
+
+from account.factories import UserFactory
+from hospital.benchmarks import compare_results, run_note_pipeline
+from hospital.models import ActionableStep, DoctorNote, DoctorNoteSearchTerm, DoctorPatientAssignment
+from hospital.services.batching import NoteBatcher, note_batcher
+from hospital.services.backends import GeminiBackend, LLMBackend, StubBackend
+from hospital.services.cache import LLMResultCache
+from hospital.services.llm import (
+    LLMClientPool, LLMExtractionFailed, LLMService, LLMUnavailable, backoff_delay, parse_retry_after
+)
+from hospital.services.ratelimit import llm_rate_limiter
+from hospital.services.metrics import llm_metrics
+from hospital.services.parsing import StepStreamParser, validate_step
+from hospital.services.search import note_search_index
+from hospital.services.scheduler import SchedulerService, dispatch_due_reminders
+from hospital.services.stub import StubModel, make_stub_server
+from hospital.tasks import claim_notes, complete_note, enqueue_doctor_note, prune_task_results, process_doctor_note, process_doctor_note_batch, requeue_stalled_notes, save_actionable_steps
+
+
+@async_unsafe
+def async_unsafe_check():
+    """Stands in for an ORM call: raises SynchronousOnlyOperation inside a running loop."""
+
+
+class UnreachableCache(LocMemCache):
+    """Cache backend that fails like django-redis does when Redis is down."""
+
+    def _fail(self, *args, **kwargs):
+        raise ConnectionInterrupted(None)
+
+    get = set = add = incr = get_many = _fail
+
+
+class FakeRedisList:
+    """Just enough of a Redis client for the note batcher's queue."""
+
+    def __init__(self):
+        self.lists = {}
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def lrange(self, key, start, end):
+        return self.lists.get(key, [])[start:end + 1]
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:]
+
+    def pipeline(self, transaction=True):
+        client, commands = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args: commands.append((name, args))
+
+            def execute(self):
+                return [getattr(client, name)(*args) for name, args in commands]
+
+        return Pipeline()
+
+
+def gemini_response(payload):
+    return httpx.Response(
+        200,
+        json={"candidates": [{"content": {"parts": [{"text": json.dumps(payload)}]}}]},
+    )
+
+
+# ------------------------------
+# Tests for the pooled LLM HTTP client
+# ------------------------------
+class TestLLMClientPool(TestCase):
+    def setUp(self):
+        self.pool = LLMClientPool()
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            return gemini_response({"checklist": [{"description": "Buy drug"}], "plan": []})
+
+        transport = httpx.MockTransport(handler)
+        patcher = patch.object(
+            LLMClientPool, "_build_client", lambda pool: httpx.AsyncClient(transport=transport)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pool.close)
+
+    def test_client_is_reused_across_notes(self):
+        with patch("hospital.services.llm.llm_client_pool", self.pool):
+            first = LLMService().extract_actionable_steps_sync("note one")
+            client = self.pool.client
+            second = LLMService().extract_actionable_steps_sync("note two")
+
+        self.assertEqual(first, ([{"description": "Buy drug"}], []))
+        self.assertEqual(second, first)
+        self.assertIs(self.pool.client, client)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_notes_on_worker_threads_can_use_the_orm(self):
+        # The -P threads pool: the pool's loop must not leak into task threads.
+        errors = []
+
+        def note(text):
+            try:
+                LLMService().extract_actionable_steps_sync(text)
+                async_unsafe_check()
+            except Exception as e:
+                errors.append(e)
+
+        with patch("hospital.services.llm.llm_client_pool", self.pool):
+            threads = [threading.Thread(target=note, args=(f"note {i}",)) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.requests), 2)
+
+    @skipUnless(find_spec("gevent"), "gevent is not installed")
+    def test_refuses_to_start_under_gevent(self):
+        script = (
+            "from gevent import monkey; monkey.patch_all()\n"
+            "import django; django.setup()\n"
+            "from hospital.services.llm import LLMClientPool\n"
+            "LLMClientPool().client\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, timeout=60,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        )
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("-P threads", result.stderr)
+
+    def test_close_is_idempotent(self):
+        self.pool.client
+        self.pool.close()
+        self.pool.close()
+        self.assertIsNotNone(self.pool.client)
+
+
+# ------------------------------
+# Tests for the LLM extraction result cache
+# ------------------------------
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestLLMResultCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        def handler(request):
+            self.calls += 1
+            return gemini_response({"checklist": [], "plan": [{"description": "Walk", "frequency": "daily", "duration": 7}]})
+
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def test_resubmitted_note_skips_network(self):
+        service = LLMService(client=self.client)
+        first = async_to_sync(service.extract_actionable_steps)("Walk  daily\nfor a week")
+        second = async_to_sync(service.extract_actionable_steps)("Walk daily for a week ")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(LLMResultCache().stats(), {"hits": 1, "misses": 1})
+
+    def test_redis_errors_are_a_miss_and_a_skipped_write(self):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+
+        result_cache = LLMResultCache()
+        with patch.object(result_cache.cache, "get", side_effect=ConnectionInterrupted(None)), \
+                patch.object(result_cache.cache, "set", side_effect=RedisConnectionError("down")), \
+                patch("hospital.services.cache.logger") as mock_logger:
+            self.assertIsNone(result_cache.get("note", "1", "model"))
+            result_cache.set("note", "1", "model", ([], []))
+        self.assertEqual(mock_logger.warning.call_count, 2)
+
+        service = LLMService(client=self.client)
+        with patch.object(service.cache.cache, "get", side_effect=ConnectionInterrupted(None)), \
+                patch.object(service.cache.cache, "set", side_effect=ConnectionInterrupted(None)):
+            result = async_to_sync(service.extract_actionable_steps)("Walk daily")
+        self.assertEqual(result[1][0]["description"], "Walk")
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(CACHES={"default": {"BACKEND": "hospital.tests.test_services.UnreachableCache"}})
+    def test_extraction_survives_a_redis_outage(self):
+        llm_metrics.incr("parse_ok")
+        result = async_to_sync(LLMService(client=self.client).extract_actionable_steps)("Walk daily")
+
+        self.assertEqual(result[1][0]["description"], "Walk")
+        self.assertEqual(self.calls, 1)
+
+    def test_key_depends_on_prompt_version_and_model(self):
+        cache = LLMResultCache()
+        key = cache.make_key("note", "1", "gemini-1.5-flash")
+        self.assertNotEqual(key, cache.make_key("note", "2", "gemini-1.5-flash"))
+        self.assertNotEqual(key, cache.make_key("note", "1", "gemini-2.0-flash"))
+
+
+# ------------------------------
+# Tests for streamed extraction
+# ------------------------------
+class TestStepStreamParser(TestCase):
+    def test_items_are_returned_as_soon_as_they_close(self):
+        text = (
+            '```json\n{"checklist": [{"description": "Buy {brace} \\"drug\\""}], '
+            '"plan": [{"description": "Walk", "frequency": "daily", "duration": 7}]}\n```'
+        )
+        parser = StepStreamParser()
+        seen = []
+        for i, char in enumerate(text):
+            for item in parser.feed(char):
+                seen.append((i, item))
+
+        self.assertEqual([item for _, item in seen], [
+            ("checklist", {"description": 'Buy {brace} "drug"'}),
+            ("plan", {"description": "Walk", "frequency": "daily", "duration": 7}),
+        ])
+        # The checklist item is complete long before the plan array starts.
+        self.assertLess(seen[0][0], text.index('"plan"'))
+
+    def test_ignores_other_keys_and_malformed_items(self):
+        parser = StepStreamParser()
+        items = parser.feed('{"note": "x", "other": [{"a": 1}], "checklist": [{"description": 1,}, {"description": "ok"}]}')
+        self.assertEqual(items, [("checklist", {"description": "ok"})])
+        self.assertEqual(parser.rejected, 1)
+        self.assertTrue(parser.done)
+
+    def test_validate_step(self):
+        self.assertEqual(
+            validate_step("plan", {"description": "Walk", "frequency": "daily", "duration": "7 days", "extra": 1}),
+            {"description": "Walk", "frequency": "daily", "duration": "7 days"},
+        )
+        self.assertIsNone(validate_step("plan", {"description": "Walk", "duration": True}))
+        self.assertIsNone(validate_step("plan", {"description": "Walk", "frequency": ["daily"]}))
+        self.assertIsNone(validate_step("checklist", {"description": "  "}))
+        self.assertIsNone(validate_step("checklist", ["Buy drug"]))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestExtractActionableStepsParsing(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+        self.reply = None
+
+        def handler(request):
+            self.requests.append(request)
+            return self.reply
+
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def extract(self, text):
+        self.reply = httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+        return async_to_sync(LLMService(client=self.client).extract_actionable_steps)(text)
+
+    def test_requests_json_mode_with_schema(self):
+        self.extract('{"checklist": [], "plan": []}')
+        body = json.loads(self.requests[0].content)
+        self.assertEqual(body["generationConfig"]["responseMimeType"], "application/json")
+        self.assertIn("plan", body["generationConfig"]["responseSchema"]["properties"])
+
+    def test_fenced_json_with_prose(self):
+        result = self.extract('Here you go:\n```json\n{"checklist": [{"description": "Buy drug"}], "plan": []}\n```')
+        self.assertEqual(result, ([{"description": "Buy drug"}], []))
+        self.assertEqual(llm_metrics.stats()["parse_ok"], 1)
+
+    def test_truncated_json_keeps_completed_items(self):
+        result = self.extract('{"checklist": [{"description": "Buy drug"}], "plan": [{"description": "Wa')
+        self.assertEqual(result, ([{"description": "Buy drug"}], []))
+        self.assertEqual(llm_metrics.stats()["parse_truncated"], 1)
+
+    def test_response_without_json_is_an_error(self):
+        with self.assertRaises(LLMExtractionFailed):
+            self.extract("I cannot help with that.")
+        stats = llm_metrics.stats()
+        self.assertEqual(stats["parse_failed"], 1)
+        self.assertEqual(stats["errors"], 1)
+        # Failures are not cached.
+        with self.assertRaises(LLMExtractionFailed):
+            self.extract("I cannot help with that.")
+        self.assertEqual(len(self.requests), 2)
+
+    def test_empty_json_means_no_steps(self):
+        self.assertEqual(self.extract('{"checklist": [], "plan": []}'), ([], []))
+        self.assertEqual(llm_metrics.stats()["errors"], 0)
+
+    def test_malformed_payload_is_an_error(self):
+        self.reply = httpx.Response(200, json={"candidates": []})
+        with self.assertRaises(LLMExtractionFailed):
+            async_to_sync(LLMService(client=self.client).extract_actionable_steps)("note")
+        self.assertEqual(llm_metrics.stats()["bad_responses"], 1)
+
+    def test_http_error_is_counted_without_logging_the_url(self):
+        self.reply = httpx.Response(400)
+        with patch("hospital.services.llm.logger") as mock_logger:
+            with self.assertRaises(LLMExtractionFailed) as ctx:
+                async_to_sync(LLMService(client=self.client).extract_actionable_steps)("note")
+        stats = llm_metrics.stats()
+        self.assertEqual(stats["http_errors"], 1)
+        self.assertEqual(stats["errors"], 1)
+        self.assertNotIn("key=", str(mock_logger.warning.call_args))
+        self.assertIsNone(ctx.exception.__cause__)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestStreamActionableSteps(TestCase):
+    def setUp(self):
+        self.requests = []
+        chunks = ['{"checklist": [{"descr', 'iption": "Buy drug"}], "plan": [', '{"description": "Walk", "frequency": "daily", "duration": 7}]}']
+        body = "".join(
+            "data: %s\r\n\r\n" % json.dumps({"candidates": [{"content": {"parts": [{"text": chunk}]}}]})
+            for chunk in chunks
+        )
+
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def stream(self, service, note_text):
+        async def collect():
+            return [item async for item in service.stream_actionable_steps(note_text)]
+        return async_to_sync(collect)()
+
+    def test_streams_items_and_caches_result(self):
+        service = LLMService(client=self.client)
+        items = self.stream(service, "Buy drug and walk")
+
+        self.assertEqual(items, [
+            ("checklist", {"description": "Buy drug"}),
+            ("plan", {"description": "Walk", "frequency": "daily", "duration": 7}),
+        ])
+        self.assertTrue(self.requests[0].url.path.endswith(":streamGenerateContent"))
+        self.assertEqual(self.requests[0].url.params["alt"], "sse")
+
+        # A resubmitted note is replayed from the cache.
+        self.assertEqual(self.stream(service, "Buy drug and walk"), items)
+        self.assertEqual(len(self.requests), 1)
+
+
+# ------------------------------
+# Tests for LLM retries and rate limiting
+# ------------------------------
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    LLM_MAX_RETRIES=2,
+)
+class TestLLMRetries(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.replies = []
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            return self.replies.pop(0)
+
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        patcher = patch("hospital.services.llm.asyncio.sleep", new_callable=AsyncMock)
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def extract(self):
+        return async_to_sync(LLMService(client=self.client).extract_actionable_steps)("Buy drug")
+
+    def test_rate_limited_call_is_retried_after_retry_after(self):
+        self.replies = [
+            httpx.Response(429, headers={"Retry-After": "3"}),
+            gemini_response({"checklist": [{"description": "Buy drug"}], "plan": []}),
+        ]
+        self.assertEqual(self.extract(), ([{"description": "Buy drug"}], []))
+        self.assertEqual(len(self.requests), 2)
+        self.assertGreaterEqual(self.sleep.await_args.args[0], 3)
+        self.assertEqual(llm_metrics.stats()["retries"], 1)
+
+    def test_exhausted_retries_raise_instead_of_dropping_steps(self):
+        self.replies = [httpx.Response(503) for _ in range(3)]
+        with self.assertRaises(LLMUnavailable):
+            self.extract()
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(llm_metrics.stats()["unavailable"], 1)
+
+    def test_long_retry_after_is_left_to_celery(self):
+        self.replies = [httpx.Response(429, headers={"Retry-After": "120"})]
+        with self.assertRaises(LLMUnavailable) as ctx:
+            self.extract()
+        self.assertEqual(ctx.exception.retry_after, 120)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_backoff_and_retry_after_parsing(self):
+        self.assertEqual(parse_retry_after("5"), 5)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertAlmostEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        for attempt in range(10):
+            self.assertLessEqual(backoff_delay(attempt), 30)
+        self.assertGreaterEqual(backoff_delay(0, retry_after=10), 10)
+
+    def test_limiter_is_a_no_op_without_redis(self):
+        self.assertEqual(llm_rate_limiter.take_token(), 0)
+        self.assertTrue(llm_rate_limiter.try_acquire_slot("token"))
+
+
+class TestProcessDoctorNoteRetries(TestCase):
+    def setUp(self):
+        self.note = DoctorNote.objects.create(
+            doctor=UserFactory(role='doctor'), patient=UserFactory(role='patient'), note_text="new"
+        )
+        self.old_step = ActionableStep.objects.create(note=self.note, step_type='checklist', description="old")
+
+    def test_autoretry_is_configured(self):
+        self.assertIn(LLMUnavailable, process_doctor_note.autoretry_for)
+        self.assertIn(LLMUnavailable, process_doctor_note_batch.autoretry_for)
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", side_effect=LLMUnavailable("down", retry_after=60))
+    def test_outage_keeps_existing_steps_and_retries(self, mock_extract):
+        with patch.object(process_doctor_note, "retry", side_effect=RuntimeError("retry")) as mock_retry:
+            with self.assertRaises(RuntimeError):
+                process_doctor_note(str(self.note.id))
+
+        self.assertEqual(mock_retry.call_args.kwargs["countdown"], 60)
+        self.old_step.refresh_from_db()
+        self.assertEqual(self.old_step.status, 'pending')
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_status, DoctorNote.PENDING)
+
+    @override_settings(LLM_RETRY_AFTER_MAX=900)
+    @patch.object(LLMService, "extract_actionable_steps_sync", side_effect=LLMUnavailable("down", retry_after=86400))
+    def test_retry_after_is_capped_below_the_visibility_timeout(self, mock_extract):
+        with patch.object(process_doctor_note, "retry", side_effect=RuntimeError("retry")) as mock_retry:
+            with self.assertRaises(RuntimeError):
+                process_doctor_note(str(self.note.id))
+
+        self.assertEqual(mock_retry.call_args.kwargs["countdown"], 900)
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", side_effect=LLMExtractionFailed("bad"))
+    def test_unusable_response_keeps_existing_steps_and_retries(self, mock_extract):
+        self.assertIn(LLMExtractionFailed, process_doctor_note.autoretry_for)
+        with patch.object(process_doctor_note, "retry", side_effect=RuntimeError("retry")):
+            with self.assertRaises(RuntimeError):
+                process_doctor_note(str(self.note.id))
+
+        self.old_step.refresh_from_db()
+        self.assertEqual(self.old_step.status, 'pending')
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_status, DoctorNote.PENDING)
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", side_effect=LLMExtractionFailed("bad"))
+    def test_unusable_response_fails_note_when_retries_run_out(self, mock_extract):
+        process_doctor_note.push_request(retries=process_doctor_note.max_retries)
+        self.addCleanup(process_doctor_note.pop_request)
+        with self.assertRaises(LLMExtractionFailed):
+            process_doctor_note.run(str(self.note.id))
+
+        self.old_step.refresh_from_db()
+        self.assertEqual(self.old_step.status, 'pending')
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_status, DoctorNote.FAILED)
+
+
+# ------------------------------
+# Tests for the pluggable LLM backend and the offline stub
+# ------------------------------
+NOTE = "Take ibuprofen daily for 2 weeks. Book a follow-up scan."
+NOTE_STEPS = (
+    [{"description": "Book a follow-up scan"}],
+    [{"description": "Take ibuprofen daily for 2 weeks", "frequency": "daily", "duration": 14}],
+)
+
+
+class TestLLMBackends(TestCase):
+    def test_default_backend_is_gemini(self):
+        service = LLMService()
+        self.assertIsInstance(service.backend, GeminiBackend)
+        self.assertEqual(service.model, "gemini-1.5-flash")
+
+    def test_incomplete_backend_cannot_be_instantiated(self):
+        class NoStreaming(LLMBackend):
+            def build_request(self, client, prompt, stream=False):
+                return client.build_request("POST", "http://llm.test", json={"prompt": prompt})
+
+            def response_text(self, data):
+                return data["text"]
+
+        with self.assertRaisesMessage(TypeError, "stream_text"):
+            NoStreaming()
+
+    def test_stub_backend_runs_in_process(self):
+        service = LLMService(backend=StubBackend(stub=StubModel()))
+        self.assertEqual(async_to_sync(service.extract_actionable_steps)(NOTE), NOTE_STEPS)
+
+        async def stream():
+            return [item async for item in service.stream_actionable_steps(NOTE)]
+
+        self.assertEqual(
+            async_to_sync(stream)(),
+            [("checklist", NOTE_STEPS[0][0]), ("plan", NOTE_STEPS[1][0])],
+        )
+
+    @override_settings(LLM_MAX_RETRIES=1)
+    @patch("hospital.services.llm.asyncio.sleep", new_callable=AsyncMock)
+    def test_stub_error_injection(self, mock_sleep):
+        service = LLMService(backend=StubBackend(stub=StubModel(rate_limit_rate=1.0)))
+        with self.assertRaises(LLMUnavailable):
+            async_to_sync(service.extract_actionable_steps)(NOTE)
+        # The stub's Retry-After was honoured before the second attempt.
+        self.assertTrue(any(call.args[0] >= 1 for call in mock_sleep.await_args_list))
+
+    def test_stub_http_server(self):
+        server = make_stub_server(StubModel(), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        host, port = server.server_address
+        backend = GeminiBackend(base_url=f"http://{host}:{port}/v1beta/models", model="stub", api_key="")
+        self.assertEqual(async_to_sync(LLMService(backend=backend).extract_actionable_steps)(NOTE), NOTE_STEPS)
+
+
+# ------------------------------
+# Tests for batched note processing
+# ------------------------------
+class TestProcessDoctorNoteBatch(TestCase):
+    def setUp(self):
+        self.doctor = UserFactory(role='doctor')
+        self.patient = UserFactory(role='patient')
+        self.other_patient = UserFactory(role='patient')
+        self.older = DoctorNote.objects.create(doctor=self.doctor, patient=self.patient, note_text="old")
+        self.newer = DoctorNote.objects.create(doctor=self.doctor, patient=self.patient, note_text="new")
+        self.other = DoctorNote.objects.create(doctor=self.doctor, patient=self.other_patient, note_text="other")
+        DoctorNote.objects.filter(id=self.older.id).update(created_at=timezone.now() - timedelta(minutes=5))
+        DoctorNote.objects.filter(id=self.other.id).update(created_at=timezone.now() + timedelta(minutes=5))
+
+    @patch.object(LLMService, "extract_actionable_steps_batch_sync")
+    def test_batch_extracts_once_and_keeps_latest_note_pending(self, mock_batch):
+        mock_batch.side_effect = lambda texts, **kwargs: [
+            ([{"description": f"{text} task"}], []) for text in texts
+        ]
+
+        process_doctor_note_batch([str(self.newer.id), str(self.other.id), str(self.older.id)])
+
+        mock_batch.assert_called_once_with(["old", "new", "other"], return_exceptions=True)
+        pending = ActionableStep.objects.filter(status='pending')
+        self.assertEqual(
+            sorted(pending.values_list('description', flat=True)),
+            ["new task", "other task"],
+        )
+        self.assertEqual(ActionableStep.objects.filter(status='cancelled').count(), 1)
+
+    def one_bad_note(self, texts, **kwargs):
+        return [
+            LLMExtractionFailed("bad") if text == "other" else ([{"description": f"{text} task"}], [])
+            for text in texts
+        ]
+
+    def statuses(self):
+        return {
+            note: DoctorNote.objects.get(pk=note.pk).processing_status
+            for note in (self.older, self.newer, self.other)
+        }
+
+    @patch.object(LLMService, "extract_actionable_steps_batch_sync")
+    def test_bad_note_is_retried_alone(self, mock_batch):
+        mock_batch.side_effect = self.one_bad_note
+        note_ids = [str(self.older.id), str(self.newer.id), str(self.other.id)]
+
+        with patch.object(process_doctor_note_batch, "retry", side_effect=RuntimeError("retry")):
+            with self.assertRaises(RuntimeError):
+                process_doctor_note_batch(note_ids)
+
+        self.assertEqual(self.statuses(), {
+            self.older: DoctorNote.DONE, self.newer: DoctorNote.DONE, self.other: DoctorNote.PENDING,
+        })
+        self.assertEqual(
+            list(ActionableStep.objects.filter(status='pending').values_list('description', flat=True)),
+            ["new task"],
+        )
+
+        # The retry only extracts the note that failed.
+        mock_batch.reset_mock()
+        with patch.object(process_doctor_note_batch, "retry", side_effect=RuntimeError("retry")):
+            with self.assertRaises(RuntimeError):
+                process_doctor_note_batch(note_ids)
+        mock_batch.assert_called_once_with(["other"], return_exceptions=True)
+
+    @patch.object(LLMService, "extract_actionable_steps_batch_sync")
+    def test_only_the_bad_note_fails_when_retries_run_out(self, mock_batch):
+        mock_batch.side_effect = self.one_bad_note
+        process_doctor_note_batch.push_request(retries=process_doctor_note_batch.max_retries)
+        self.addCleanup(process_doctor_note_batch.pop_request)
+
+        with self.assertRaises(LLMExtractionFailed):
+            process_doctor_note_batch.run([str(self.older.id), str(self.newer.id), str(self.other.id)])
+
+        self.assertEqual(self.statuses(), {
+            self.older: DoctorNote.DONE, self.newer: DoctorNote.DONE, self.other: DoctorNote.FAILED,
+        })
+
+    @patch("hospital.tasks.process_doctor_note.delay")
+    def test_enqueue_falls_back_to_single_task_without_redis(self, mock_delay):
+        with override_settings(LLM_BATCH_ENABLED=True):
+            enqueue_doctor_note(str(self.newer.id))
+        mock_delay.assert_called_once_with(str(self.newer.id))
+
+
+@override_settings(
+    LLM_BATCH_ENABLED=True,
+    LLM_BATCH_SIZE=3,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class TestNoteBatchWindow(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = patch.object(NoteBatcher, "_redis_client", return_value=FakeRedisList())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("hospital.tasks.flush_doctor_note_batch")
+    def test_notes_share_a_window_until_it_is_flushed(self, mock_flush):
+        enqueue_doctor_note("first")
+        enqueue_doctor_note("second")
+        self.assertEqual(mock_flush.apply_async.call_count, 1)
+
+        self.assertEqual(note_batcher.pop_batch(), ["first", "second"])
+
+        # Pushed while the flushed window's key would still be alive.
+        enqueue_doctor_note("third")
+        self.assertEqual(mock_flush.apply_async.call_count, 2)
+        self.assertEqual(note_batcher.pop_batch(), ["third"])
+
+
+# ------------------------------
+# Tests for actionable step persistence
+# ------------------------------
+class TestSaveActionableSteps(TestCase):
+    def setUp(self):
+        self.note = DoctorNote.objects.create(
+            doctor=UserFactory(role='doctor'),
+            patient=UserFactory(role='patient'),
+            note_text="Test note",
+        )
+
+    def items(self, count):
+        checklist = [{"description": f"Task {i}"} for i in range(count)]
+        plan = [{"description": f"Plan {i}", "frequency": "daily", "duration": 7} for i in range(count)]
+        return checklist, plan
+
+    def test_query_count_does_not_grow_with_steps(self):
+        with self.assertNumQueries(1):
+            save_actionable_steps(self.note, *self.items(1))
+        with self.assertNumQueries(1):
+            save_actionable_steps(self.note, *self.items(10))
+        self.assertEqual(self.note.actionable_steps.count(), 22)
+
+    def test_plan_steps_are_handed_to_the_dispatcher(self):
+        save_actionable_steps(self.note, *self.items(3))
+
+        plan_steps = self.note.actionable_steps.filter(step_type='plan')
+        self.assertEqual(plan_steps.filter(next_check_at__gt=timezone.now()).count(), 3)
+        self.assertFalse(
+            self.note.actionable_steps.filter(step_type='checklist', next_check_at__isnull=False).exists()
+        )
+
+
+    def test_step_saved_without_patient_takes_the_notes(self):
+        step = ActionableStep.objects.create(note=self.note, step_type='checklist', description="Buy drug")
+
+        self.assertEqual(step.patient_id, self.note.patient_id)
+        self.assertEqual(ActionableStep.objects.get(pk=step.pk).patient_id, self.note.patient_id)
+
+
+# ------------------------------
+# Tests for unique doctor-patient assignments
+# ------------------------------
+class TestUniqueAssignment(TestCase):
+    def setUp(self):
+        self.patient = UserFactory(role='patient')
+        self.doctor = UserFactory(role='doctor')
+        DoctorPatientAssignment.objects.create(patient=self.patient, doctor=self.doctor)
+
+    def test_second_assignment_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DoctorPatientAssignment.objects.create(patient=self.patient, doctor=self.doctor)
+
+    def test_bulk_create_ignores_existing_assignment(self):
+        other = UserFactory(role='doctor')
+        DoctorPatientAssignment.objects.bulk_create(
+            [DoctorPatientAssignment(patient=self.patient, doctor=doctor) for doctor in (self.doctor, other)],
+            ignore_conflicts=True,
+        )
+
+        self.assertEqual(DoctorPatientAssignment.objects.filter(patient=self.patient, doctor=self.doctor).count(), 1)
+        self.assertEqual(DoctorPatientAssignment.objects.filter(patient=self.patient).count(), 2)
+
+
+class TestAssignmentDedupeMigration(TransactionTestCase):
+    before = [('hospital', '0005_actionablestep_patient')]
+    after = [('hospital', '0006_step_patient_indexes_and_unique_assignment')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_collapse_to_the_earliest_assignment(self):
+        patient = UserFactory(role='patient')
+        doctor, other = UserFactory(role='doctor'), UserFactory(role='doctor')
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        Assignment = executor.loader.project_state(self.before).apps.get_model('hospital', 'DoctorPatientAssignment')
+
+        now = timezone.now()
+        first = Assignment.objects.create(patient_id=patient.pk, doctor_id=doctor.pk, assigned_at=now - timedelta(days=2))
+        Assignment.objects.create(patient_id=patient.pk, doctor_id=doctor.pk, assigned_at=now - timedelta(days=1))
+        Assignment.objects.create(patient_id=patient.pk, doctor_id=doctor.pk, assigned_at=now)
+        kept = Assignment.objects.create(patient_id=patient.pk, doctor_id=other.pk, assigned_at=now)
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+
+        remaining = DoctorPatientAssignment.objects.filter(patient_id=patient.pk)
+        self.assertEqual(sorted(remaining.values_list('id', flat=True)), sorted([first.id, kept.id]))
+
+
+# ------------------------------
+# Tests for the periodic reminder dispatcher
+# ------------------------------
+class TestDispatchDueReminders(TestCase):
+    def setUp(self):
+        self.note = DoctorNote.objects.create(
+            doctor=UserFactory(role='doctor'),
+            patient=UserFactory(role='patient'),
+            note_text="Test note",
+        )
+        self.now = timezone.now()
+
+    def make_step(self, duration=7, next_check_at=None):
+        return ActionableStep.objects.create(
+            note=self.note,
+            step_type='plan',
+            description="Walk",
+            schedule=SchedulerService.create_schedule('daily', duration),
+            next_check_at=next_check_at or self.now - timedelta(minutes=1),
+        )
+
+    @override_settings(REMINDER_DISPATCH_BATCH_SIZE=2)
+    def test_processes_due_steps_in_batches(self):
+        due = [self.make_step() for _ in range(5)]
+        not_due = self.make_step(next_check_at=self.now + timedelta(hours=1))
+
+        self.assertEqual(dispatch_due_reminders(), 5)
+
+        for step in due:
+            step.refresh_from_db()
+            self.assertEqual(step.schedule_events.filter(event_type='missed').count(), 1)
+            self.assertGreater(step.next_check_at, self.now)
+        self.assertFalse(not_due.schedule_events.exists())
+
+    def test_check_in_today_is_not_a_missed_day(self):
+        checked_in = self.make_step()
+        SchedulerService.record_check_in(checked_in, self.now)
+        other = self.make_step()
+
+        with self.assertNumQueries(2):
+            SchedulerService.check_steps([checked_in, other], self.now)
+
+        self.assertFalse(checked_in.schedule_events.filter(event_type='missed').exists())
+        self.assertTrue(other.schedule_events.filter(event_type='missed').exists())
+
+    def test_check_in_extends_end_date_by_missed_days(self):
+        step = self.make_step()
+        original_end = datetime.fromisoformat(step.schedule['end_date'])
+        SchedulerService.check_step(step, self.now - timedelta(days=2))
+        SchedulerService.check_step(step, self.now - timedelta(days=1))
+
+        SchedulerService.record_check_in(step, self.now)
+        SchedulerService.record_check_in(step, self.now)
+
+        step.refresh_from_db()
+        self.assertEqual(datetime.fromisoformat(step.schedule['end_date']), original_end + timedelta(days=2))
+        self.assertEqual(step.schedule_events.filter(event_type='completed').count(), 1)
+
+    def test_expired_plan_is_completed(self):
+        step = self.make_step(duration=0)
+        step.schedule['end_date'] = (self.now - timedelta(days=1)).isoformat()
+        step.save()
+
+        dispatch_due_reminders()
+
+        step.refresh_from_db()
+        self.assertEqual(step.status, 'completed')
+        self.assertIsNone(step.next_check_at)
+
+
+# ------------------------------
+# Tests for the note pipeline benchmark
+# ------------------------------
+class TestNotePipelineBenchmark(TestCase):
+    def test_run_reports_throughput_latency_and_queries(self):
+        results = run_note_pipeline(doctors=2, patients=4, notes=8)
+
+        self.assertGreater(results["notes_per_sec"], 0)
+        self.assertEqual(set(results["latency"]), {"request", "process", "total"})
+        self.assertEqual(results["params"]["notes"], 8)
+        self.assertEqual(DoctorNote.objects.count(), 8)
+        # A new note supersedes the patient's pending steps, so each of the
+        # four patients is left with the plan from their latest note.
+        self.assertEqual(results["reminders"]["steps"], 4)
+        self.assertEqual(results["reminders"]["dispatched"], 4)
+        self.assertFalse(
+            ActionableStep.objects.filter(status="pending", next_check_at__lte=timezone.now()).exists()
+        )
+        # Guard against N+1 queries creeping into the pipeline.
+        self.assertLessEqual(results["queries_per_note"]["request"], 6)
+        # Claim (select, update), patient lock, completion, supersede check,
+        # cancel and insert.
+        self.assertLessEqual(results["queries_per_note"]["process"], 7)
+
+    def test_compare_results_flags_regressions(self):
+        baseline = {"notes_per_sec": 100.0, "latency": {"total": {"p99_ms": 10.0}}, "params": {"notes": 8}}
+        current = {"notes_per_sec": 80.0, "latency": {"total": {"p99_ms": 10.5}}, "params": {"notes": 100}}
+
+        rows = {row["metric"]: row for row in compare_results(current, baseline, tolerance=0.1)}
+
+        self.assertEqual(set(rows), {"notes_per_sec", "latency.total.p99_ms"})
+        self.assertTrue(rows["notes_per_sec"]["regression"])
+        self.assertFalse(rows["latency.total.p99_ms"]["regression"])
+
+
+# ------------------------------
+# Tests for the blind keyword index of encrypted notes
+# ------------------------------
+class TestNoteSearchIndex(TestCase):
+    def setUp(self):
+        self.doctor = UserFactory(role="doctor")
+        self.patient = UserFactory(role="patient")
+        self.note = DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="Take Ibuprofen twice daily. Book an X-ray."
+        )
+        self.other = DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="Rest and drink water."
+        )
+
+    def search(self, query):
+        return set(DoctorNote.objects.filter(id__in=note_search_index.matching_note_ids(query)).values_list("id", flat=True))
+
+    def test_terms_are_stored_as_keyed_hashes(self):
+        stored = set(self.note.search_terms.values_list("term_hash", flat=True))
+
+        self.assertIn(note_search_index.hash_term("ibuprofen"), stored)
+        self.assertNotIn("ibuprofen", stored)
+        with override_settings(NOTE_SEARCH_KEY="another-key"):
+            self.assertNotIn(note_search_index.hash_term("ibuprofen"), stored)
+
+    def test_key_is_not_the_raw_secret_key(self):
+        import hashlib
+        import hmac
+        from django.conf import settings
+
+        raw = hmac.new(settings.SECRET_KEY.encode(), b"ibuprofen", hashlib.sha256).hexdigest()
+        self.assertNotEqual(note_search_index.hash_term("ibuprofen"), raw)
+
+    def test_matches_whole_words_case_insensitively(self):
+        self.assertEqual(self.search("IBUPROFEN"), {self.note.id})
+        self.assertEqual(self.search("ibuprofen daily"), {self.note.id})
+        self.assertEqual(self.search("ibuprofen water"), set())
+        self.assertEqual(self.search("ibu"), set())
+        self.assertEqual(self.search(""), set())
+
+    def test_index_follows_note_text(self):
+        self.note.note_text = "Switch to paracetamol."
+        self.note.save()
+
+        self.assertEqual(self.search("paracetamol"), {self.note.id})
+        self.assertEqual(self.search("ibuprofen"), set())
+
+    def test_saving_without_the_text_keeps_the_index(self):
+        note = DoctorNote.objects.without_note_text().get(id=self.note.id)
+        note.save()
+
+        self.assertEqual(self.search("ibuprofen"), {self.note.id})
+
+    def test_admin_search_uses_the_index(self):
+        from django.contrib import admin
+        from django.test import RequestFactory
+
+        model_admin = admin.site._registry[DoctorNote]
+        request = RequestFactory().get("/admin/hospital/doctornote/")
+        results, _ = model_admin.get_search_results(request, DoctorNote.objects.all(), "x-ray")
+
+        self.assertEqual(set(results.values_list("id", flat=True)), {self.note.id})
+
+    def test_rebuild_command_restores_missing_terms(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        DoctorNoteSearchTerm.objects.all().delete()
+        call_command("rebuild_note_search_index", chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self.search("water"), {self.other.id})
+        self.assertEqual(self.search("ibuprofen"), {self.note.id})
+
+
+# ------------------------------
+# Tests for re-encrypting notes after a key rotation
+# ------------------------------
+class TestRotateNoteEncryption(TestCase):
+    def setUp(self):
+        from hospital.services.encryption import cipher_for
+
+        doctor = UserFactory(role="doctor")
+        patient = UserFactory(role="patient")
+        self.texts = [f"Note number {i}" for i in range(5)]
+        self.notes = [DoctorNote.objects.create(doctor=doctor, patient=patient, note_text=text) for text in self.texts]
+        self.current = DoctorNote.objects.create(doctor=doctor, patient=patient, note_text="Already current")
+
+        # Rewrite the first notes as if they were encrypted under an old SECRET_KEY.
+        old = cipher_for("old-secret-key")
+        DoctorNote.objects.bulk_update([
+            DoctorNote(pk=note.pk, note_text=Value(old.encrypt(pickle.dumps(text)), output_field=BinaryField()))
+            for note, text in zip(self.notes, self.texts)
+        ], ["note_text"])
+
+    def rotate(self, **options):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        with patch.dict("os.environ", {"OLD_SECRET_KEY": "old-secret-key"}):
+            call_command("rotate_note_encryption", stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def stored_texts(self):
+        return [DoctorNote.objects.get(pk=note.pk).note_text for note in self.notes]
+
+    def test_old_ciphertext_is_unreadable_before_rotation(self):
+        from django.core.signing import BadSignature
+
+        with self.assertRaises(BadSignature):
+            DoctorNote.objects.get(pk=self.notes[0].pk).note_text
+
+    def test_rotates_in_process(self):
+        output = self.rotate(workers=0, batch_size=2)
+
+        self.assertEqual(self.stored_texts(), self.texts)
+        self.assertEqual(DoctorNote.objects.get(pk=self.current.pk).note_text, "Already current")
+        self.assertIn("Rotated 5 note(s), 1 already current, 0 unreadable", output)
+
+    def test_rotates_across_worker_processes(self):
+        # Spawned workers re-read settings, and without SECRET_KEY in the
+        # environment would each make up their own.
+        with patch.dict("os.environ"):
+            os.environ.pop("SECRET_KEY", None)
+            self.rotate(workers=2, batch_size=2)
+
+        self.assertEqual(self.stored_texts(), self.texts)
+
+    def test_notes_saved_during_rotation_are_not_overwritten(self):
+        from hospital.services import encryption
+
+        reencrypt = encryption.reencrypt
+
+        def reencrypt_then_edit(rows):
+            results = reencrypt(rows)
+            note = DoctorNote.objects.without_note_text().get(pk=self.notes[0].pk)
+            note.note_text = "Edited meanwhile"
+            note.save()
+            return results
+
+        with patch.object(encryption, "reencrypt", side_effect=reencrypt_then_edit):
+            output = self.rotate(workers=0, batch_size=10)
+
+        self.assertEqual(self.stored_texts(), ["Edited meanwhile"] + self.texts[1:])
+        self.assertIn("Rotated 4 note(s), 2 already current", output)
+
+    def test_dry_run_writes_nothing(self):
+        output = self.rotate(workers=0, dry_run=True)
+
+        self.assertIn("Would rotate 5 note(s)", output)
+        self.assertEqual(self.rotate(workers=0).count("Rotated 5 note(s)"), 1)
+
+    def test_resumes_from_checkpoint(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = f"{directory}/rotation.json"
+            self.rotate(workers=0, batch_size=4, checkpoint=checkpoint)
+            state = json.loads(open(checkpoint).read())
+            self.assertEqual(state["last_pk"], str(max(DoctorNote.objects.values_list("pk", flat=True))))
+
+            output = self.rotate(workers=0, checkpoint=checkpoint)
+
+        self.assertIn("0 scanned", output)
+        self.assertEqual(self.stored_texts(), self.texts)
+
+
+# ------------------------------
+# Tests for Celery queue routing
+# ------------------------------
+class TestCeleryRouting(TestCase):
+    def queue_for(self, task_name):
+        from config.utils.celery import app
+
+        return app.amqp.router.route({}, task_name)["queue"].name
+
+    def test_llm_and_reminder_tasks_use_separate_queues(self):
+        self.assertEqual(self.queue_for("hospital.tasks.process_doctor_note"), "llm")
+        self.assertEqual(self.queue_for("hospital.tasks.process_doctor_note_batch"), "llm")
+        self.assertEqual(self.queue_for("hospital.services.scheduler.dispatch_due_reminders"), "reminders")
+        self.assertEqual(self.queue_for("hospital.services.scheduler.schedule_check_reminder"), "reminders")
+        self.assertEqual(self.queue_for("hospital.tasks.flush_doctor_note_batch"), "default")
+
+
+# ------------------------------
+# Tests for Celery result storage
+# ------------------------------
+class TestTaskResults(TestCase):
+    def test_fire_and_forget_tasks_store_no_result(self):
+        from hospital.services.scheduler import schedule_check_reminder
+        from hospital.tasks import flush_doctor_note_batch
+
+        for task in (process_doctor_note, process_doctor_note_batch, flush_doctor_note_batch,
+                     dispatch_due_reminders, schedule_check_reminder, prune_task_results):
+            self.assertTrue(task.ignore_result, task.name)
+
+    @override_settings(TASK_RESULT_RETENTION=timedelta(days=7), TASK_RESULT_PRUNE_BATCH_SIZE=2)
+    def test_prune_deletes_old_results_in_batches(self):
+        from django_celery_results.models import TaskResult
+
+        now = timezone.now()
+        for i in range(5):
+            TaskResult.objects.create(task_id=f"old-{i}", status="SUCCESS")
+        TaskResult.objects.create(task_id="recent", status="SUCCESS")
+        TaskResult.objects.filter(task_id__startswith="old-").update(date_done=now - timedelta(days=8))
+
+        self.assertEqual(prune_task_results(), 5)
+        self.assertEqual(list(TaskResult.objects.values_list("task_id", flat=True)), ["recent"])
+
+
+# ------------------------------
+# Tests for deduplicated note processing
+# ------------------------------
+class TestProcessDoctorNoteIdempotency(TestCase):
+    def setUp(self):
+        self.doctor = UserFactory(role='doctor')
+        self.patient = UserFactory(role='patient')
+        self.note = DoctorNote.objects.create(doctor=self.doctor, patient=self.patient, note_text=NOTE)
+
+    def pending_descriptions(self):
+        return sorted(
+            ActionableStep.objects.filter(patient=self.patient, status='pending').values_list('description', flat=True)
+        )
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", return_value=NOTE_STEPS)
+    def test_duplicate_delivery_skips_the_llm(self, mock_extract):
+        process_doctor_note.apply(args=[str(self.note.id)], task_id="delivery-1")
+        process_doctor_note.apply(args=[str(self.note.id)], task_id="delivery-2")
+
+        mock_extract.assert_called_once()
+        self.assertEqual(ActionableStep.objects.filter(note=self.note).count(), 2)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_status, DoctorNote.DONE)
+        self.assertIsNotNone(self.note.processed_at)
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", return_value=NOTE_STEPS)
+    def test_note_held_by_another_delivery_is_skipped(self, mock_extract):
+        claim_notes([str(self.note.id)], claim="other-task")
+
+        process_doctor_note.apply(args=[str(self.note.id)], task_id="delivery-2")
+
+        mock_extract.assert_not_called()
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_claim, "other-task")
+
+    @patch.object(LLMService, "extract_actionable_steps_sync", return_value=NOTE_STEPS)
+    def test_redelivery_of_the_same_task_resumes(self, mock_extract):
+        claim_notes([str(self.note.id)], claim="delivery-1")
+
+        process_doctor_note.apply(args=[str(self.note.id)], task_id="delivery-1")
+
+        mock_extract.assert_called_once()
+        self.assertEqual(len(self.pending_descriptions()), 2)
+
+    @override_settings(NOTE_PROCESSING_TIMEOUT=60)
+    @patch.object(LLMService, "extract_actionable_steps_sync", return_value=NOTE_STEPS)
+    def test_stale_claim_is_taken_over(self, mock_extract):
+        [stale] = claim_notes([str(self.note.id)], claim="dead-worker")
+        DoctorNote.objects.filter(id=self.note.id).update(processing_started_at=timezone.now() - timedelta(minutes=5))
+
+        process_doctor_note.apply(args=[str(self.note.id)], task_id="delivery-2")
+
+        mock_extract.assert_called_once()
+        # The dead worker's late result is discarded.
+        self.assertFalse(complete_note(stale, [{"description": "stale"}], []))
+        self.assertNotIn("stale", self.pending_descriptions())
+
+    def test_older_note_does_not_overwrite_a_newer_one(self):
+        newer = DoctorNote.objects.create(doctor=self.doctor, patient=self.patient, note_text="newer")
+        older_claim, newer_claim = claim_notes([str(self.note.id), str(newer.id)])
+
+        self.assertTrue(complete_note(newer_claim, [{"description": "from newer"}], []))
+        self.assertTrue(complete_note(older_claim, [{"description": "from older"}], []))
+
+        self.assertEqual(self.pending_descriptions(), ["from newer"])
+
+    @override_settings(NOTE_PROCESSING_TIMEOUT=60)
+    def test_stalled_notes_are_requeued(self):
+        long_ago = timezone.now() - timedelta(minutes=5)
+        # A streamed note whose request died, and a note Celery gave up on.
+        abandoned = DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="abandoned",
+            processing_status=DoctorNote.PROCESSING, processing_claim="dead-stream", processing_started_at=long_ago,
+        )
+        given_up = DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="given up",
+            processing_status=DoctorNote.PENDING, processing_started_at=long_ago,
+        )
+        DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="in progress",
+            processing_status=DoctorNote.PROCESSING, processing_claim="live", processing_started_at=timezone.now(),
+        )
+        DoctorNote.objects.create(
+            doctor=self.doctor, patient=self.patient, note_text="done", processing_status=DoctorNote.DONE,
+        )
+        DoctorNote.objects.filter(pk__in=[abandoned.pk, given_up.pk]).update(created_at=long_ago)
+
+        with patch("hospital.tasks.enqueue_doctor_note") as mock_enqueue:
+            self.assertEqual(requeue_stalled_notes(), 2)
+
+        # self.note was only just created, so it is still on its way.
+        self.assertEqual(
+            sorted(call.args[0] for call in mock_enqueue.call_args_list),
+            sorted([str(abandoned.id), str(given_up.id)]),
+        )
+
+    @override_settings(NOTE_PROCESSING_TIMEOUT=60)
+    @patch.object(LLMService, "extract_actionable_steps_sync", return_value=NOTE_STEPS)
+    def test_requeued_note_is_processed(self, mock_extract):
+        claim_notes([str(self.note.id)], claim="dead-stream")
+        DoctorNote.objects.filter(id=self.note.id).update(processing_started_at=timezone.now() - timedelta(minutes=5))
+
+        requeue_stalled_notes()
+
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.processing_status, DoctorNote.DONE)
+        self.assertEqual(len(self.pending_descriptions()), 2)
+
+    def test_patient_lock_key_is_a_stable_bigint(self):
+        from hospital.services.locks import patient_lock_key
+
+        self.assertEqual(patient_lock_key(self.patient.id), patient_lock_key(str(self.patient.id)))
+        self.assertNotEqual(patient_lock_key(self.patient.id), patient_lock_key(self.doctor.id))
+        self.assertLess(abs(patient_lock_key(self.patient.id)), 2 ** 63)
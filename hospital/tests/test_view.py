@@ -3,16 +3,27 @@ import uuid
 from datetime import datetime
 from unittest.mock import patch, AsyncMock, MagicMock
 
+import httpx
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 from asgiref.sync import async_to_sync
 
 from config.testing.base import BaseAPITest
+from config.utils.pagination import KeysetPagination
 from account.factories import UserFactory
+from account.models import User
 from hospital.models import DoctorPatientAssignment, DoctorNote, ActionableStep
 from hospital.services.llm import LLMService
 from hospital.services.scheduler import SchedulerService
+from hospital.views import DoctorListView, DoctorNoteCreateView, DoctorNoteStreamView
 
 # ------------------------------
 # Tests for the Doctor List Endpoint
@@ -27,7 +38,7 @@ class TestDoctorListEndpoint(BaseAPITest):
 
     def test_doctor_list_paginated(self):
         url = reverse("doctor_list")
-        response = self.client.get(url)
+        response = self.client.get(url, {"page": 1})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Check if response is paginated.
         if "results" in response.data:
@@ -37,6 +48,114 @@ class TestDoctorListEndpoint(BaseAPITest):
         else:
             self.assertEqual(len(response.data), 2)
 
+    @patch.object(KeysetPagination, "page_size", 2)
+    def test_doctor_list_cursor_pagination(self):
+        doctors = [self.doctor1, self.doctor2] + [UserFactory(role='doctor') for _ in range(3)]
+        url = reverse("doctor_list")
+
+        seen = []
+        pages = 0
+        response = self.client.get(url)
+        while True:
+            pages += 1
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen += [doctor["id"] for doctor in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, [str(doctor.id) for doctor in sorted(doctors, key=lambda d: (d.date_joined, d.id))])
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestDoctorListCache(BaseAPITest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.patient = UserFactory(role='patient')
+        self.doctor = UserFactory(role='doctor')
+        self.client.force_authenticate(user=self.patient)
+        self.url = reverse("doctor_list")
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_unrelated_params_and_host_share_the_cache(self):
+        first = self.client.get(self.url, {"page": "1"})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {"page": "01", "utm_source": "mail"}, HTTP_HOST="testserver:80")
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        # Different pages are still cached apart.
+        self.assertNotIn("count", self.client.get(self.url).data)
+
+    @patch.object(KeysetPagination, "page_size", 1)
+    def test_links_follow_each_request_host(self):
+        UserFactory(role='doctor')
+        self.client.get(self.url, {"utm_source": "mail"}, HTTP_HOST="first.example")
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_HOST="second.example", secure=True)
+
+        self.assertTrue(response.data["next"].startswith("https://second.example/"))
+        self.assertNotIn("utm_source", response.data["next"])
+
+    def test_media_urls_follow_each_request_host(self):
+        view = DoctorListView()
+        view.request = None
+        first = APIRequestFactory().get(self.url, HTTP_HOST="first.example")
+        second = APIRequestFactory().get(self.url, HTTP_HOST="second.example", secure=True)
+        page = {"next": None, "previous": None, "results": [
+            {"id": "1", "profile_picture": "http://first.example/media/a.png?expires=1&signature=x"},
+        ]}
+
+        cached = view.relative_page(first, page)
+        self.assertEqual(cached["results"][0]["profile_picture"], "/media/a.png?expires=1&signature=x")
+        self.assertEqual(
+            view.absolute_page(second, cached)["results"][0]["profile_picture"],
+            "https://second.example/media/a.png?expires=1&signature=x",
+        )
+
+    @override_settings(DOCTOR_DIRECTORY_CACHE_TTL=7200, MEDIA_URL_TTL=600)
+    def test_entries_do_not_outlive_signed_media_urls(self):
+        with patch("hospital.services.directory.cache.set") as mock_set:
+            self.client.get(self.url)
+        self.assertEqual(mock_set.call_args.kwargs["timeout"], 600)
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+    def test_doctor_changes_invalidate_cache(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_doctor = UserFactory(role='doctor')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_doctor = User.objects.get(pk=new_doctor.pk)
+            new_doctor.role = 'patient'
+            new_doctor.save()
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_patient_changes_keep_cache(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserFactory(role='patient')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
 # ------------------------------
 # Tests for the Patient Select Doctor Endpoint
 # ------------------------------
@@ -80,6 +199,36 @@ class TestPatientSelectDoctorEndpoint(BaseAPITest):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_select_doctor_invalid_id_writes_nothing(self):
+        url = reverse("patient_select_doctor")
+        data = {"doctor_ids": [str(self.doctor.id), str(uuid.uuid4())], "action": "select"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(DoctorPatientAssignment.objects.filter(patient=self.patient).exists())
+
+    def test_select_many_doctors_query_count_is_constant(self):
+        url = reverse("patient_select_doctor")
+        doctors = [UserFactory(role='doctor') for _ in range(50)]
+
+        with CaptureQueriesContext(connection) as one_doctor:
+            self.client.post(url, {"doctor_ids": [str(self.doctor.id)], "action": "select"}, format="json")
+        DoctorPatientAssignment.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as many_doctors:
+            response = self.client.post(
+                url, {"doctor_ids": [str(d.id) for d in doctors], "action": "select"}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(many_doctors), len(one_doctor))
+        self.assertEqual(DoctorPatientAssignment.objects.filter(patient=self.patient).count(), 50)
+
+        # Selecting the same doctors again is a no-op rather than an error.
+        response = self.client.post(
+            url, {"doctor_ids": [str(d.id) for d in doctors], "action": "select"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(DoctorPatientAssignment.objects.filter(patient=self.patient).count(), 50)
+
     def test_deselect_doctor(self):
         url = reverse("patient_select_doctor")
         # First, select a doctor.
@@ -147,6 +296,58 @@ class TestDoctorPatientListEndpoint(BaseAPITest):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def add_patient_with_notes(self, notes=2, steps=3):
+        patient = UserFactory(role='patient')
+        DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=patient)
+        for _ in range(notes):
+            note = DoctorNote.objects.create(doctor=self.doctor, patient=patient, note_text="Note")
+            for i in range(steps):
+                ActionableStep.objects.create(note=note, step_type="checklist", description=f"Task {i}")
+        # A note from another doctor must not leak into this doctor's view.
+        DoctorNote.objects.create(doctor=UserFactory(role='doctor'), patient=patient, note_text="Other")
+        return patient
+
+    def test_doctor_patient_list_query_count_is_constant(self):
+        url = reverse("doctor_patient_list")
+        self.add_patient_with_notes()
+
+        with CaptureQueriesContext(connection) as few_patients:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for _ in range(5):
+            self.add_patient_with_notes()
+
+        with CaptureQueriesContext(connection) as many_patients:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(len(many_patients), len(few_patients))
+        assignments = response.data["results"] if "results" in response.data else response.data
+        self.assertEqual(len(assignments), 7)
+        by_patient = {a["patient"]["id"]: a for a in assignments}
+        self.assertEqual(by_patient[str(self.patient.id)]["note_count"], 0)
+        busy = [a for a in assignments if a["notes"]]
+        self.assertTrue(all(a["note_count"] == 2 and len(a["notes"]) == 2 for a in busy))
+        self.assertTrue(all(len(n["actionable_steps"]) == 3 for a in busy for n in a["notes"]))
+
+    def test_doctor_patient_list_note_text_is_opt_in(self):
+        url = reverse("doctor_patient_list")
+        self.add_patient_with_notes(notes=1, steps=0)
+
+        with patch.object(DoctorNote._meta.get_field("note_text"), "from_db_value") as decrypt:
+            response = self.client.get(url)
+        decrypt.assert_not_called()
+        assignments = response.data["results"] if "results" in response.data else response.data
+        notes = [n for a in assignments for n in a["notes"]]
+        self.assertEqual(len(notes), 1)
+        self.assertNotIn("note_text", notes[0])
+
+        response = self.client.get(url, {"include": "note_text"})
+        assignments = response.data["results"] if "results" in response.data else response.data
+        notes = [n for a in assignments for n in a["notes"]]
+        self.assertEqual(notes[0]["note_text"], "Note")
+
 # ------------------------------
 # Tests for the Doctor Note Create Endpoint
 # ------------------------------
@@ -171,6 +372,47 @@ class TestDoctorNoteCreateEndpoint(BaseAPITest):
         # Assert that the asynchronous task was triggered.
         mock_delay.assert_called_once()
 
+    @patch("hospital.views.process_doctor_note.delay")
+    async def test_create_doctor_note_on_event_loop(self, mock_delay):
+        self.assertTrue(DoctorNoteCreateView.view_is_async)
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.doctor)}"}
+        data = {"patient": str(self.patient.id), "note_text": "Async note"}
+        response = await AsyncClient().post(
+            reverse("doctor_note_create"), data, content_type="application/json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        note = await DoctorNote.objects.aget(id=response.json()["data"]["id"])
+        self.assertEqual(note.note_text, "Async note")
+        mock_delay.assert_called_once_with(str(note.id))
+
+    async def test_create_doctor_note_unknown_patient_on_event_loop(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.doctor)}"}
+        data = {"patient": str(uuid.uuid4()), "note_text": "Async note"}
+        response = await AsyncClient().post(
+            reverse("doctor_note_create"), data, content_type="application/json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch("hospital.views.process_doctor_note.delay")
+    def test_create_doctor_note_with_idempotency_key_is_not_duplicated(self, mock_delay):
+        self.client.force_authenticate(user=self.doctor)
+        url = reverse("doctor_note_create")
+        data = {"patient": str(self.patient.id), "note_text": "Retried note"}
+        first = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="submit-1")
+        second = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="submit-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(DoctorNote.objects.count(), 1)
+        mock_delay.assert_called_once()
+
+    def test_create_doctor_note_idempotency_key_too_long(self):
+        self.client.force_authenticate(user=self.doctor)
+        url = reverse("doctor_note_create")
+        data = {"patient": str(self.patient.id), "note_text": "Test note"}
+        response = self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY="k" * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_doctor_note_invalid_role(self):
         self.client.force_authenticate(user=self.patient)
         url = reverse("doctor_note_create")
@@ -197,6 +439,67 @@ class TestDoctorNoteCreateEndpoint(BaseAPITest):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data["detail"], "The noteText field is required.")
 
+# ------------------------------
+# Tests for the streamed Doctor Note Endpoint
+# ------------------------------
+class TestDoctorNoteStreamEndpoint(BaseAPITest):
+    def setUp(self):
+        super().setUp()
+        self.doctor = UserFactory(role='doctor')
+        self.patient = UserFactory(role='patient')
+        DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patient)
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.doctor)}"}
+
+    async def post_and_read_events(self):
+        data = {"patient": str(self.patient.id), "note_text": "Buy drug, walk daily"}
+        response = await AsyncClient().post(
+            reverse("doctor_note_stream"), data, content_type="application/json", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    async def test_streams_items_and_saves_steps(self):
+        self.assertTrue(DoctorNoteStreamView.view_is_async)
+
+        async def fake_stream(service, note_text):
+            yield "checklist", {"description": "Buy drug"}
+            yield "plan", {"description": "Walk", "frequency": "daily", "duration": 7}
+
+        with patch.object(LLMService, "stream_actionable_steps", fake_stream), \
+                patch("hospital.views.process_doctor_note.delay") as mock_delay:
+            events = await self.post_and_read_events()
+
+        self.assertEqual([event for event, _ in events], ["note", "checklist", "plan", "done"])
+        self.assertEqual(events[1][1], {"description": "Buy drug"})
+        self.assertEqual(events[-1][1], {"checklist": 1, "plan": 1})
+        mock_delay.assert_not_called()
+        steps = ActionableStep.objects.filter(note_id=events[0][1]["id"], status="pending")
+        self.assertEqual(await steps.acount(), 2)
+        note = await DoctorNote.objects.aget(id=events[0][1]["id"])
+        self.assertEqual(note.processing_status, DoctorNote.DONE)
+
+    async def test_model_failure_falls_back_to_background_processing(self):
+        async def failing_stream(service, note_text):
+            raise httpx.ConnectError("down")
+            yield
+
+        with patch.object(LLMService, "stream_actionable_steps", failing_stream), \
+                patch("hospital.views.process_doctor_note.delay") as mock_delay:
+            events = await self.post_and_read_events()
+
+        self.assertEqual([event for event, _ in events], ["note", "error"])
+        mock_delay.assert_called_once_with(events[0][1]["id"])
+        # Released, so the background task can claim it.
+        note = await DoctorNote.objects.aget(id=events[0][1]["id"])
+        self.assertEqual(note.processing_status, DoctorNote.PENDING)
+
+
 # ------------------------------
 # Tests for the Actionable Step Endpoints (List and Update)
 # ------------------------------
@@ -227,6 +530,12 @@ class TestActionableStepEndpoints(BaseAPITest):
         self.assertEqual(len(steps), 1)
         self.assertEqual(steps[0]["description"], "Initial task")
 
+    async def test_get_actionable_steps_under_asgi(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.patient)}"}
+        response = await AsyncClient().get(reverse("actionable_step_list"), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([s["description"] for s in response.json()["data"]["results"]], ["Initial task"])
+
     def test_update_actionable_step_status(self):
         url = reverse("actionable_step_update", args=[self.action_step.id])
         data = {"status": "completed"}
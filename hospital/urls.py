@@ -4,6 +4,7 @@ from .views import (
     PatientSelectDoctorView,
     DoctorPatientListView,
     DoctorNoteCreateView,
+    DoctorNoteStreamView,
     ActionableStepListView,
     ActionableStepUpdateView,
     PatientDoctorListView,
@@ -15,6 +16,7 @@ urlpatterns = [
     path('patients/doctors/', PatientDoctorListView.as_view(), name='patient_doctor_list'),
     path('doctors/patients/', DoctorPatientListView.as_view(), name='doctor_patient_list'),
     path('notes/', DoctorNoteCreateView.as_view(), name='doctor_note_create'),
+    path('notes/stream/', DoctorNoteStreamView.as_view(), name='doctor_note_stream'),
     path('reminders/', ActionableStepListView.as_view(), name='actionable_step_list'),
     path('reminders/<uuid:pk>/', ActionableStepUpdateView.as_view(), name='actionable_step_update'),
 ]
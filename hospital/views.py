@@ -1,11 +1,25 @@
+import json
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+import httpx
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.db.models import Count, Prefetch, Q
+from django.http import Http404, HttpResponseNotModified, QueryDict, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import parse_etags
 from account.models import User
 from account.serializers import UserSerializer
+from config.utils.views import AsyncAPIViewMixin
 from .models import DoctorNote, ActionableStep, DoctorPatientAssignment
+from .services.directory import doctor_directory_cache
+from .services.llm import LLMExtractionFailed, LLMService, LLMUnavailable
 from .serializers import (
     DoctorNoteSerializer,
     ActionableStepSerializer,
@@ -13,15 +27,100 @@ from .serializers import (
     DoctorPatientAssignmentSerializer,
     PatientDoctorAssignmentSerializer
 )
-from .tasks import process_doctor_note
+from .tasks import (
+    complete_note,
+    enqueue_doctor_note,
+    process_doctor_note,
+    release_notes,
+)
 
 # List available doctors (for patients)
 class DoctorListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
+    # Users have no created_at; date_joined is covered by the doctor index.
+    pagination_ordering = ('date_joined', 'id')
+    # Absolute URLs in a page, cached relative to the site and made absolute
+    # again for each request's own scheme and host.
+    link_fields = ('next', 'previous')
+    url_fields = ('profile_picture', 'profile_thumbnail')
 
     def get_queryset(self):
-        return User.objects.filter(role='doctor')
+        return User.objects.filter(role='doctor').order_by(*self.pagination_ordering)
+
+    def page_params(self, query_params):
+        """
+        The query parameters that select a page, normalized.
+
+        Anything else in the URL (or the Host header) does not change the
+        response, so it must not split the cache either.
+        """
+        paginator = self.paginator
+        params = {}
+        cursor = query_params.get(paginator.cursor_query_param)
+        if cursor:
+            params[paginator.cursor_query_param] = cursor
+        for name in (paginator.page_number_query_param, getattr(paginator, 'page_size_query_param', None)):
+            if name and name in query_params:
+                value = query_params[name].strip()
+                params[name] = str(int(value)) if value.isdigit() else value
+        return params
+
+    def relative_page(self, request, data):
+        """Strip the request's origin from a page's URLs, and unused parameters from its links."""
+        origin = request.build_absolute_uri('/')[:-1]
+        data = dict(data)
+        for field in self.link_fields:
+            if data.get(field):
+                link = urlsplit(data[field])
+                params = self.page_params(QueryDict(link.query))
+                data[field] = f"{link.path}?{urlencode(params)}" if params else link.path
+        data['results'] = [
+            {
+                **item,
+                **{
+                    field: item[field][len(origin):]
+                    for field in self.url_fields
+                    if isinstance(item.get(field), str) and item[field].startswith(origin)
+                },
+            }
+            for item in data['results']
+        ]
+        return data
+
+    def absolute_page(self, request, data):
+        """Make a cached page's URLs absolute for this request."""
+        data = dict(data)
+        for field in self.link_fields:
+            if data.get(field):
+                data[field] = request.build_absolute_uri(data[field])
+        data['results'] = [
+            {
+                **item,
+                **{
+                    field: request.build_absolute_uri(item[field])
+                    for field in self.url_fields
+                    if isinstance(item.get(field), str) and item[field].startswith('/')
+                },
+            }
+            for item in data['results']
+        ]
+        return data
+
+    def list(self, request, *args, **kwargs):
+        # Pages are cached per page parameters and invalidated by bumping the
+        # directory version whenever a doctor changes.
+        cache_key = doctor_directory_cache.make_key(self.page_params(request.query_params))
+        cached = doctor_directory_cache.get(cache_key)
+        if cached is None:
+            response = super().list(request, *args, **kwargs)
+            cached = doctor_directory_cache.set(cache_key, self.relative_page(request, response.data))
+        data, etag = cached
+
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return HttpResponseNotModified(headers=headers)
+        return Response(self.absolute_page(request, data), headers=headers)
 
 # Endpoint for a patient to select a doctor
 class PatientSelectDoctorView(generics.CreateAPIView):
@@ -60,73 +159,256 @@ class PatientDoctorListView(generics.ListAPIView):
     def get_queryset(self):
         if self.request.user.role != 'patient':
             raise PermissionDenied("Only patients can view their selected doctors.")
-        return DoctorPatientAssignment.objects.filter(patient=self.request.user)
+        return (
+            DoctorPatientAssignment.objects.filter(patient=self.request.user)
+            .select_related('doctor')
+            .order_by('created_at', 'id')
+        )
     
 # Endpoint for a doctor to view their assigned patients
 class DoctorPatientListView(generics.ListAPIView):
     """
     Endpoint for a doctor to view their assigned patients.
+    Note bodies are omitted unless requested with ``?include=note_text``.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = DoctorPatientAssignmentSerializer
 
+    def include_note_text(self):
+        include = self.request.query_params.get('include', '')
+        return 'note_text' in include.split(',')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_note_text'] = self.include_note_text()
+        return context
+
     def get_queryset(self):
         if self.request.user.role != 'doctor':
             raise PermissionDenied("Only doctors can view their assigned patients.")
-        return DoctorPatientAssignment.objects.filter(doctor=self.request.user)
+        doctor = self.request.user
+        # Load patients, this doctor's notes and their steps in a fixed
+        # number of queries, however many patients are on the page.
+        notes = (
+            DoctorNote.objects.filter(doctor=doctor)
+            .prefetch_related('actionable_steps')
+            .order_by('created_at')
+        )
+        if not self.include_note_text():
+            notes = notes.without_note_text()
+        return (
+            DoctorPatientAssignment.objects.filter(doctor=doctor)
+            .select_related('patient')
+            .prefetch_related(
+                Prefetch('patient__patient_notes', queryset=notes, to_attr='notes_by_doctor')
+            )
+            .annotate(
+                note_count=Count(
+                    'patient__patient_notes',
+                    filter=Q(patient__patient_notes__doctor=doctor),
+                )
+            )
+            .order_by('created_at', 'id')
+        )
 
 # Endpoint for doctors to submit a note (triggers LLM processing)
-class DoctorNoteCreateView(generics.CreateAPIView):
+class DoctorNoteCreateView(AsyncAPIViewMixin, generics.CreateAPIView):
+    """
+    Runs on the event loop under ASGI; lookups and the insert use the
+    async ORM, so a slow database does not hold a worker thread.
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = DoctorNoteSerializer
 
-    def post(self, request, *args, **kwargs):
+    async def create_note(self, request):
+        """
+        Validate the submission and insert the note.
+
+        Returns:
+            Tuple of (note, None) on success, or (None, error_response)
+        """
         if request.user.role != 'doctor':
-            return Response(
+            return None, Response(
                 {'detail': 'Only doctors can submit notes.'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
         patient_id = request.data.get('patient')
-        patient = get_object_or_404(User, id=patient_id, role='patient')
+        try:
+            patient = await User.objects.aget(id=patient_id, role='patient')
+        except User.DoesNotExist:
+            raise Http404
         
         # Check that the patient is assigned to this doctor.
-        assignment_exists = DoctorPatientAssignment.objects.filter(
+        assignment_exists = await DoctorPatientAssignment.objects.filter(
             doctor=request.user, patient=patient
-        ).exists()
+        ).aexists()
         if not assignment_exists:
-            return Response(
+            return None, Response(
                 {'detail': 'This patient is not assigned to you.'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
         note_text = request.data.get('note_text')
         if note_text is None:
-            return Response(
+            return None, Response(
                 {'detail': 'The noteText field is required.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        doctor_note = DoctorNote.objects.create(
-            doctor=request.user,
-            patient=patient,
-            note_text=note_text
-        )
+
+        # A retried submission with the same Idempotency-Key gets the note
+        # created the first time instead of a duplicate.
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key is not None and len(idempotency_key) > 255:
+            return None, Response(
+                {'detail': 'The Idempotency-Key header is limited to 255 characters.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if idempotency_key is not None:
+            existing = await DoctorNote.objects.filter(
+                doctor=request.user, idempotency_key=idempotency_key
+            ).afirst()
+            if existing is not None:
+                self.replayed = True
+                return existing, None
+
+        try:
+            doctor_note = await DoctorNote.objects.acreate(
+                doctor=request.user,
+                patient=patient,
+                note_text=note_text,
+                idempotency_key=idempotency_key,
+                **self.initial_note_state(),
+            )
+        except IntegrityError:
+            # A concurrent request with the same key won the insert.
+            doctor_note = await DoctorNote.objects.aget(
+                doctor=request.user, idempotency_key=idempotency_key
+            )
+            self.replayed = True
+        return doctor_note, None
+
+    def initial_note_state(self):
+        """Extra field values for a new note; processed by a worker by default."""
+        return {}
+
+    replayed = False
+
+    async def post(self, request, *args, **kwargs):
+        doctor_note, error = await self.create_note(request)
+        if error is not None:
+            return error
+
+        if self.replayed:
+            data = await sync_to_async(lambda: self.get_serializer(doctor_note).data)()
+            return Response(data, status=status.HTTP_200_OK)
+
         # Trigger asynchronous LLM processing to extract actionable steps.
-        process_doctor_note.delay(str(doctor_note.id))
+        # Publishing to the broker is blocking I/O, so it runs off the loop.
+        await sync_to_async(enqueue_doctor_note)(str(doctor_note.id))
         
-        serializer = self.get_serializer(doctor_note)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # Serializing reads the note's steps, which needs the sync ORM.
+        data = await sync_to_async(lambda: self.get_serializer(doctor_note).data)()
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+# Endpoint for doctors to submit a note and watch its steps being extracted
+class DoctorNoteStreamView(DoctorNoteCreateView):
+    """
+    Submit a note and receive its actionable steps as Server-Sent Events.
+
+    The stream opens with a ``note`` event carrying the saved note, then
+    sends one ``checklist`` or ``plan`` event per item as the model writes
+    it, and ends with ``done``. The steps are saved when the stream
+    completes. If the model call fails or the client disconnects, the
+    note is handed to the background worker instead (and ``error`` is sent
+    when the client is still there). Under ASGI the model call is awaited
+    on the event loop, so no worker thread is held while it runs.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        doctor_note, error = await self.create_note(request)
+        if error is not None:
+            return error
+
+        note_data = await sync_to_async(lambda: self.get_serializer(doctor_note).data)()
+        if self.replayed:
+            stream = self.replay_steps(doctor_note, note_data)
+        else:
+            stream = self.stream_steps(doctor_note, note_data)
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+    def initial_note_state(self):
+        # The note is extracted in this request, so it starts out claimed.
+        return {
+            'processing_status': DoctorNote.PROCESSING,
+            'processing_claim': uuid.uuid4().hex,
+            'processing_started_at': timezone.now(),
+        }
+
+    @staticmethod
+    def save_steps(note, checklist_items, plan_items):
+        complete_note(note, checklist_items, plan_items)
+
+    @staticmethod
+    def hand_over(note):
+        """Release the note and let a worker extract it instead."""
+        release_notes([note])
+        enqueue_doctor_note(str(note.id))
+
+    async def replay_steps(self, note, note_data):
+        yield self.format_event('note', note_data)
+        yield self.format_event('done', {
+            'checklist': len([step for step in note_data['actionable_steps'] if step['step_type'] == 'checklist']),
+            'plan': len([step for step in note_data['actionable_steps'] if step['step_type'] == 'plan']),
+        })
+
+    async def stream_steps(self, note, note_data):
+        yield self.format_event('note', note_data)
+
+        items = {'checklist': [], 'plan': []}
+        try:
+            async for kind, item in LLMService().stream_actionable_steps(note.note_text):
+                items[kind].append(item)
+                yield self.format_event(kind, item)
+        except (httpx.HTTPError, LLMUnavailable, LLMExtractionFailed):
+            await sync_to_async(self.hand_over)(note)
+            yield self.format_event('error', {'detail': 'Extraction will be completed in the background.'})
+            return
+        except BaseException:
+            # The client disconnected mid-stream; finish the note in the background.
+            await sync_to_async(self.hand_over)(note)
+            raise
+
+        await sync_to_async(self.save_steps)(note, items['checklist'], items['plan'])
+        yield self.format_event('done', {
+            'checklist': len(items['checklist']),
+            'plan': len(items['plan']),
+        })
 
 
 # Endpoint for patients to retrieve their actionable steps (reminders)
 class ActionableStepListView(generics.ListAPIView):
+    """
+    Synchronous on purpose: DRF pagination has no async ORM path, so an
+    async handler would only add a second thread hop under ASGI.
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = ActionableStepSerializer
 
     def get_queryset(self):
         if self.request.user.role == 'patient':
-            return ActionableStep.objects.filter(note__patient=self.request.user, status='pending')
+            return ActionableStep.objects.filter(
+                patient=self.request.user, status='pending'
+            ).order_by('created_at', 'id')
         return ActionableStep.objects.none()
 
 # Endpoint to update the status of an actionable step (e.g., mark as completed)